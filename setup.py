@@ -31,7 +31,7 @@ setup(
     packages=find_packages(where="src"),
     package_dir={"": "src"},
     install_requires=[
-        "pynvml>=11.0.0",
+        "nvidia-ml-py>=12.535",
         "requests>=2.25.0"
     ],
     extras_require={
@@ -41,6 +41,9 @@ setup(
         ':python_version < "3.8"': [
             "typing-extensions>=3.7.4",
         ],
+        "fast": [
+            "orjson>=3.0.0",
+        ],
     },
     python_requires=">=3.6",
     classifiers=[
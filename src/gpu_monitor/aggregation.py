@@ -14,32 +14,46 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 # gpu_monitor/aggregation.py
-import statistics
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from .logging import log_message
 
+def _reduce_device(item: Tuple[Any, Dict[str, Any]]) -> Dict[str, Any]:
+    """Reduce one device's per-metric sample lists to mean/min/max values."""
+    device_id, device = item
+    aggregated_gpu = {"device_id": device_id, "name": device["name"]}
+    # Plain builtins beat NumPy here: converting each short sample list to an
+    # array costs more than the reductions save, and min/max keep their int type
+    for key, values in device["metrics"].items():
+        aggregated_gpu[f"{key}_mean"] = sum(values) / len(values)
+        aggregated_gpu[f"{key}_min"] = min(values)
+        aggregated_gpu[f"{key}_max"] = max(values)
+    return aggregated_gpu
+
 def aggregate_gpu_data(collections: List[List[Dict[str, Any]]], verbose: bool = False) -> List[Dict[str, Any]]:
     if not collections:
         log_message("No collections to aggregate", verbose=verbose)
         return []
+    # Group samples per device as flat per-metric value lists
     device_data = {}
     for collection in collections:
         for gpu in collection:
             device_id = gpu["device_id"]
-            if device_id not in device_data:
-                device_data[device_id] = []
-            device_data[device_id].append(gpu)
-    aggregated_data = []
-    for device_id, gpu_list in device_data.items():
-        aggregated_gpu = {"device_id": device_id, "name": gpu_list[-1]["name"]}
-        numeric_keys = [k for k, v in gpu_list[0].items() if isinstance(v, (int, float))]
-        for key in numeric_keys:
-            values = [gpu[key] for gpu in gpu_list if key in gpu]
-            if values:
-                aggregated_gpu[f"{key}_mean"] = statistics.mean(values)
-                aggregated_gpu[f"{key}_min"] = min(values)
-                aggregated_gpu[f"{key}_max"] = max(values)
-        aggregated_data.append(aggregated_gpu)
-    log_message(f"Aggregated GPU data: {json.dumps(aggregated_data)}", verbose=verbose)
-    return aggregated_data
+            device = device_data.get(device_id)
+            if device is None:
+                device = device_data[device_id] = {"name": None, "metrics": {}}
+            device["name"] = gpu["name"]
+            metrics = device["metrics"]
+            for key, value in gpu.items():
+                # NaN readings (value != value) would poison the mean, skip them
+                if isinstance(value, (int, float)) and value == value:
+                    values = metrics.get(key)
+                    if values is None:
+                        values = metrics[key] = []
+                    values.append(value)
+    # The reductions hold the GIL, so a thread pool only adds overhead here
+    aggregated_data = [_reduce_device(item) for item in device_data.items()]
+    # Only pay for serializing the result when it will actually be shown
+    if verbose:
+        log_message(f"Aggregated GPU data: {json.dumps(aggregated_data)}", verbose=verbose)
+    return aggregated_data
\ No newline at end of file
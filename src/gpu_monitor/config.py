@@ -18,15 +18,26 @@ import os
 import sys
 import json
 import argparse
-from typing import Dict, Any
+import functools
+from copy import deepcopy
+from typing import Dict, Any, Optional
+
+# The platform never changes while the process runs
+_IS_DARWIN = sys.platform == 'darwin'
 
 # Default configuration values
 DEFAULT_INTERVALS = {
     'retry': 300,  # Retry interval in seconds (5 minutes)
     'collection': 60,  # Collection interval in seconds (1 minute)
-    'aggregation': 3600  # Aggregation interval in seconds (1 hour)
+    'aggregation': 3600,  # Aggregation interval in seconds (1 hour)
+    'flush': 300,  # Maximum time buffered collections wait before being written (5 minutes)
+    'retention': 3600  # Interval in seconds between old-data cleanups (1 hour)
 }
 
+# GPU sensors such as temperature and power refresh slowly, so polling faster
+# than this only burns CPU and perturbs the workload being measured
+MIN_COLLECTION_INTERVAL = 5
+
 # Handle path differences between operating systems
 if sys.platform == 'win32':
     DEFAULT_PATHS = {
@@ -77,27 +88,41 @@ def parse_args() -> argparse.Namespace:
                       help='Output format for collection data (default: json)')
     return parser.parse_args()
 
-def load_config_file(config_path=None):  # type: (str) -> Dict[str, Any]
+@functools.lru_cache(maxsize=8)
+def _read_config_file(path, mtime_ns):  # type: (str, int) -> Dict[str, Any]
+    """Parse a configuration file; keying on mtime drops entries for edited files."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _load_cached(path):  # type: (str) -> Dict[str, Any]
+    """Return a private copy of the parsed configuration file at path."""
+    path = os.path.normpath(os.path.abspath(path))
+    # Callers mutate the result, so never hand out the cached object itself
+    return deepcopy(_read_config_file(path, os.stat(path).st_mtime_ns))
+
+def load_config_file(config_path=None):  # type: (Optional[str]) -> Dict[str, Any]
     """Load configuration from file."""
     if config_path and os.path.exists(config_path):
         try:
-            with open(config_path, 'r') as f:
-                return json.load(f)
+            return _load_cached(config_path)
         except Exception as e:
             print(f"Error loading config file {config_path}: {str(e)}")
-            return DEFAULT_CONFIG
+            return deepcopy(DEFAULT_CONFIG)
 
     # Try default config paths
     for path in DEFAULT_CONFIG_PATHS:
         if os.path.exists(path):
             try:
-                with open(path, 'r') as f:
-                    return json.load(f)
+                return _load_cached(path)
             except Exception as e:
                 print(f"Error loading config file {path}: {str(e)}")
                 continue
 
-    return DEFAULT_CONFIG
+    return deepcopy(DEFAULT_CONFIG)
+
+def clear_config_cache():  # type: () -> None
+    """Forget cached configuration so the next load re-reads it from disk."""
+    _read_config_file.cache_clear()
 
 def get_config(args):  # type: (argparse.Namespace) -> Dict[str, Any]
     """Get configuration from file and command line arguments."""
@@ -116,8 +141,21 @@ def get_config(args):  # type: (argparse.Namespace) -> Dict[str, Any]
     elif args.verbose:
         config['logging']['level'] = 'DEBUG'
 
+    # Polling interval from the environment overrides the config file
+    intervals = config.setdefault('intervals', dict(DEFAULT_INTERVALS))
+    intervals.setdefault('collection', DEFAULT_INTERVALS['collection'])
+    poll_interval = os.environ.get('GPU_POLL_INTERVAL_SECONDS')
+    if poll_interval:
+        try:
+            intervals['collection'] = float(poll_interval)
+        except ValueError:
+            print(f"Ignoring invalid GPU_POLL_INTERVAL_SECONDS={poll_interval}")
+    if intervals['collection'] < MIN_COLLECTION_INTERVAL:
+        print(f"Collection interval raised to the {MIN_COLLECTION_INTERVAL}s minimum")
+        intervals['collection'] = MIN_COLLECTION_INTERVAL
+
     # Platform-specific adjustments
-    if sys.platform == 'darwin':
+    if _IS_DARWIN:
         # macOS-specific adjustments
         config['intervals']['collection'] = max(config['intervals']['collection'], 300)  # Minimum 5 minutes on macOS
 
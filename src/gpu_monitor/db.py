@@ -17,19 +17,253 @@
 import os
 import sys
 import json
+import queue
 import sqlite3
 import datetime
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Sequence, Tuple
+
+# orjson is optional; fall back to the standard library codec when it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# Stored in PRAGMA user_version; bump when the schema created below changes
+SCHEMA_VERSION = 8
+
+# The send_summary trigger upserts (3.24+) and collections are unpacked with
+# the JSON1 functions, so older or JSON1-less builds can't create the schema
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+# SQLite 3.45+ stores collection documents as pre-parsed JSONB so the json_*
+# functions don't re-parse them; older engines keep plain JSON text
+_JSONB = sqlite3.sqlite_version_info >= (3, 45, 0)
+_DATA_IN = 'jsonb(?)' if _JSONB else '?'
+_DATA_OUT = 'json(data)' if _JSONB else 'data'
+
+# All times are stored as INTEGER epoch microseconds so range scans, ordering
+# and key lookups compare integers instead of ISO strings
+_SQL_CREATE_COLLECTIONS = '''
+    CREATE TABLE IF NOT EXISTS collections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        sent INTEGER DEFAULT 0,
+        error TEXT
+    )
+'''
+
+_SQL_CREATE_AGGREGATED = '''
+    CREATE TABLE IF NOT EXISTS aggregated_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        aggregation_time INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        sent INTEGER DEFAULT 0,
+        error TEXT
+    )
+'''
+_SQL_CREATE_SEND_ATTEMPTS = '''
+    CREATE TABLE IF NOT EXISTS send_attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        aggregation_time INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        success INTEGER DEFAULT 0,
+        error TEXT,
+        uid TEXT,
+        params TEXT,
+        attempt_number INTEGER DEFAULT 1
+    )
+'''
+_SQL_CREATE_SEND_SUMMARY = '''
+    CREATE TABLE IF NOT EXISTS send_summary (
+        aggregation_time INTEGER PRIMARY KEY,
+        attempts INTEGER NOT NULL,
+        first_attempt INTEGER NOT NULL,
+        last_attempt INTEGER NOT NULL,
+        last_error TEXT,
+        uid TEXT,
+        sent INTEGER DEFAULT 0
+    )
+'''
+
+# Per-GPU samples flattened into typed columns, one row per GPU per collection
+_SQL_CREATE_GPU_SAMPLES = '''
+    CREATE TABLE IF NOT EXISTS gpu_samples (
+        ts INTEGER NOT NULL,
+        gpu_uid TEXT,
+        temperature REAL,
+        memory_used INTEGER,
+        gpu_utilization INTEGER,
+        memory_utilization INTEGER,
+        power_usage REAL,
+        fan_speed INTEGER,
+        graphics_clock INTEGER,
+        memory_clock INTEGER
+    )
+'''
+_GPU_SAMPLE_COLUMNS = '''
+    ts, gpu_uid, temperature, memory_used, gpu_utilization, memory_utilization,
+    power_usage, fan_speed, graphics_clock, memory_clock
+'''
+_GPU_SAMPLE_VALUES = '''
+    COALESCE(json_extract(gpu.value, '$.uid'), json_extract(gpu.value, '$.device_id')),
+    json_extract(gpu.value, '$.temperature'),
+    json_extract(gpu.value, '$.memory_used'),
+    json_extract(gpu.value, '$.gpu_utilization'),
+    json_extract(gpu.value, '$.memory_utilization'),
+    json_extract(gpu.value, '$.power_usage'),
+    json_extract(gpu.value, '$.fan_speed'),
+    json_extract(gpu.value, '$.graphics_clock'),
+    json_extract(gpu.value, '$.memory_clock')
+'''
+
+# Hot-path statements, kept as constants so every call hits sqlite3's statement cache
+_SQL_INSERT_COLLECTION = f'INSERT INTO collections (timestamp, data) VALUES (?, {_DATA_IN})'
+_SQL_INSERT_GPU_SAMPLES = f'''
+    INSERT INTO gpu_samples ({_GPU_SAMPLE_COLUMNS})
+    SELECT ?, {_GPU_SAMPLE_VALUES}
+    FROM json_each(?, '$.gpus') AS gpu
+'''
+_SQL_INSERT_AGGREGATED = 'INSERT INTO aggregated_data (aggregation_time, data) VALUES (?, ?)'
+_SQL_INSERT_SEND_ATTEMPT = '''
+    INSERT INTO send_attempts (
+        aggregation_time, timestamp, success, error, uid, params, attempt_number
+    )
+    SELECT ?, ?, ?, ?, ?, ?, COALESCE(MAX(attempt_number), 0) + 1
+    FROM send_attempts
+    WHERE aggregation_time = ?
+'''
+
+# Retention deletes at most this many rows per transaction so the writer isn't
+# blocked for long and each WAL commit stays small
+_RETENTION_BATCH_SIZE = 5000
+
+# Single-statement writes queued by concurrent callers are committed together,
+# up to this many per transaction
+_WRITE_BATCH_SIZE = 64
+
+# Accepted values for the journal/sync overrides; PRAGMA values can't be bound
+_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def _check_sqlite_support(conn: sqlite3.Connection) -> None:
+    """Raise NotSupportedError if the SQLite library can't run this schema."""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        required = '.'.join(map(str, MIN_SQLITE_VERSION))
+        raise sqlite3.NotSupportedError(
+            f"gpu_monitor requires SQLite {required} or newer, found {sqlite3.sqlite_version}")
+    try:
+        conn.execute("SELECT json_valid('{}')")
+    except sqlite3.OperationalError:
+        raise sqlite3.NotSupportedError(
+            "gpu_monitor requires SQLite built with the JSON1 extension") from None
+
+def _pragma_setting(env_var: str, default: str, allowed: Tuple[str, ...]) -> str:
+    """Read a PRAGMA value override from the environment."""
+    value = os.environ.get(env_var, default).upper()
+    if value not in allowed:
+        logger.warning(f"Ignoring invalid {env_var}={value}, using {default}")
+        return default
+    return value
+
+# Formats accepted for timestamps given as strings (CLI input, older rows)
+_ISO_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d %H:%M',
+)
+
+if hasattr(time, 'time_ns'):
+    def _now_us() -> int:
+        """Return the current time as epoch microseconds."""
+        return time.time_ns() // 1000
+else:
+    # Python 3.6 has no time_ns(); float seconds still carry microseconds
+    def _now_us() -> int:
+        """Return the current time as epoch microseconds."""
+        return int(time.time() * 1000000)
+
+def _to_us(value: Any) -> Optional[int]:
+    """Convert a local datetime, ISO string or epoch-microsecond value to epoch microseconds."""
+    # None passes through so NOT NULL constraints still report missing times
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        for fmt in _ISO_FORMATS:
+            try:
+                value = datetime.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Invalid timestamp: {value}")
+    return int(value.replace(microsecond=0).timestamp()) * 1000000 + value.microsecond
+
+def _to_iso(us: int) -> str:
+    """Format epoch microseconds as a local ISO-8601 timestamp for display."""
+    seconds, micros = divmod(us, 1000000)
+    return datetime.datetime.fromtimestamp(seconds).replace(microsecond=micros).isoformat()
+
+_SUMMARY_TIME_COLUMNS = ('aggregation_time', 'first_attempt', 'last_attempt')
+
+def _with_iso_times(row: sqlite3.Row, columns: Tuple[str, ...]) -> Dict[str, Any]:
+    """Return row as a dict with the given epoch-microsecond columns as ISO strings."""
+    result = dict(row)
+    for column in columns:
+        if result.get(column) is not None:
+            result[column] = _to_iso(result[column])
+    return result
+
+def _normalize_gpus(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return data with an old-style gpus dict converted to the array format."""
+    if not isinstance(data.get('gpus'), dict):
+        return data
+    gpus_array = [
+        {**gpu_data, 'uid': f"gpu_{gpu_id}_{str(gpu_data.get('name', '')).replace(' ', '_')}"}
+        for gpu_id, gpu_data in data['gpus'].items()
+    ]
+    return {**data, 'gpus': gpus_array}
+
+def _dumps(data: Any) -> str:
+    """Serialize data to a compact JSON string for storage."""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'))
+
+def _loads(text: str) -> Any:
+    """Parse a stored JSON string."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
 class Database:
     """Database handler for GPU metrics."""
     
-    def __init__(self, db_file: str, verbose: bool = False):
-        """Initialize database connection."""
+    def __init__(self, db_file: str, verbose: bool = False, flush_every_n: int = 1,
+                 flush_every_sec: float = 0.0):
+        """Initialize database connection.
+
+        Collections are buffered in memory and written in one transaction once
+        flush_every_n are pending or the oldest has waited flush_every_sec
+        seconds (0 disables the age check). The defaults write immediately.
+        """
         self.verbose = verbose
+        self.flush_every_n = max(1, flush_every_n)
+        self.flush_every_sec = flush_every_sec
+        self._pending = []  # type: List[Tuple[int, str]]
+        self._pending_since = None  # type: Optional[float]
+        self._retention_thread = None  # type: Optional[threading.Thread]
+        self._retention_stop = threading.Event()
         # Create database directory if it doesn't exist
         db_dir = os.path.dirname(db_file)
         if db_dir and not os.path.exists(db_dir):
@@ -38,32 +272,163 @@ class Database:
         if self.verbose:
             logger.debug(f"Opening database at: {os.path.abspath(db_file)}")
         
-        # Connect to database
-        self.conn = sqlite3.connect(db_file)
-        self.conn.row_factory = sqlite3.Row
+        # Connect to database; the collection loop writes from a worker thread,
+        # so the shared connection is guarded by a lock. Autocommit mode is
+        # used and multi-statement writes open explicit transactions.
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None,
+                                    cached_statements=256)
+        try:
+            _check_sqlite_support(self.conn)
+        except sqlite3.NotSupportedError:
+            self.conn.close()
+            raise
+        
+        # WAL lets readers run alongside the writer and NORMAL sync drops the
+        # per-commit fsync; at most the last transaction is lost on power loss.
+        # Operators who need rollback-journal durability can override both.
+        journal_mode = _pragma_setting('GPU_MONITOR_JOURNAL_MODE', 'WAL', _JOURNAL_MODES)
+        synchronous = _pragma_setting('GPU_MONITOR_SYNCHRONOUS', 'NORMAL', _SYNCHRONOUS_MODES)
+        active_mode = self.conn.execute(f"PRAGMA journal_mode={journal_mode}").fetchone()[0]
+        # In-memory databases (used by the tests) always report 'memory'
+        if active_mode.upper() not in (journal_mode, 'MEMORY'):
+            logger.warning(f"Requested journal mode {journal_mode} but database uses {active_mode}")
+        elif self.verbose:
+            logger.debug(f"Database journal mode: {active_mode}")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-4000")
+        self.conn.execute("PRAGMA mmap_size=67108864")
+        self.conn.execute("PRAGMA wal_autocheckpoint=1000")
         
-        # Check if tables exist
-        cursor = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='collections'")
-        if not cursor.fetchone():
+        # Only run the DDL when the schema is older than this code expects
+        schema_version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version < SCHEMA_VERSION:
             if self.verbose:
                 logger.info("Creating database tables...")
             self._create_tables()
+        elif schema_version > SCHEMA_VERSION:
+            logger.warning(f"Database schema version {schema_version} is newer than "
+                           f"this version of gpu_monitor supports ({SCHEMA_VERSION})")
         elif self.verbose:
             logger.debug("Database tables already exist")
+        
+        # Small writes from the collection, send and retention threads go
+        # through one writer thread so concurrent ones share a commit
+        self._write_queue = queue.Queue()  # type: queue.Queue
+        # Guards enqueueing against close(), so nothing lands behind the sentinel
+        self._write_queue_lock = threading.Lock()
+        self._write_queue_closed = False
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, name='gpu-monitor-db-writer', daemon=True
+        )
+        self._writer_thread.start()
     
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        """Execute a read whose rows are accessed by column name.
+
+        Only these cursors build sqlite3.Row objects; writes and scalar reads
+        on the connection keep the cheaper tuple rows.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor.execute(sql, params)
+
+    def _write(self, sql: str, params: Sequence[Any]) -> int:
+        """Run a single-statement write on the writer thread and return its lastrowid.
+
+        Must not be called while holding self._lock, which the writer needs.
+        """
+        future = Future()  # type: Future
+        with self._write_queue_lock:
+            if self._write_queue_closed or not self._writer_thread.is_alive():
+                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+            self._write_queue.put((sql, params, future))
+        return future.result()
+
+    def _writer_loop(self) -> None:
+        """Commit queued writes in batches until close() sends None."""
+        item = None  # type: Optional[Tuple[str, Sequence[Any], Future]]
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < _WRITE_BATCH_SIZE:
+                try:
+                    item = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    break
+                batch.append(item)
+            self._run_write_batch(batch)
+            if item is None:
+                break
+        # Nothing is queued after the sentinel, but never leave a caller waiting
+        while True:
+            try:
+                item = self._write_queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[2].set_exception(sqlite3.ProgrammingError("Cannot operate on a closed database."))
+
+    def _run_write_batch(self, batch: List[Tuple[str, Sequence[Any], Future]]) -> None:
+        """Execute queued writes in one transaction and resolve their futures."""
+        try:
+            with self._write_transaction():
+                row_ids = [self.conn.execute(sql, params).lastrowid for sql, params, _ in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+            else:
+                # Retry one by one so only the failing write reports the error
+                for item in batch:
+                    self._run_write_batch([item])
+            return
+        for (_, _, future), row_id in zip(batch, row_ids):
+            future.set_result(row_id)
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[None]:
+        """Run a multi-statement write in one explicit transaction.
+
+        BEGIN IMMEDIATE takes the write lock up front, so a concurrent reader
+        can't make the upgrade from a read transaction fail with SQLITE_BUSY.
+        """
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
     def _create_tables(self) -> None:
         """Create database tables if they don't exist."""
-        with self.conn:
+        with self._write_transaction():
+            # The summary trigger is recreated below; drop it first so rebuilding
+            # the tables it references can't leave it pointing at a renamed copy
+            self.conn.execute('DROP TRIGGER IF EXISTS send_attempts_after_insert')
+            
             # Raw collections table (30 days retention)
-            self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS collections (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    sent INTEGER DEFAULT 0,
-                    error TEXT
-                )
-            ''')
+            self.conn.execute(_SQL_CREATE_COLLECTIONS)
+            self._migrate_time_columns('collections', _SQL_CREATE_COLLECTIONS, ('timestamp',))
+            self._migrate_gpu_shape()
+            
+            # Flattened per-GPU samples; expand collections stored before it existed
+            has_samples = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='gpu_samples'"
+            ).fetchone()
+            self.conn.execute(_SQL_CREATE_GPU_SAMPLES)
+            if not has_samples:
+                self.conn.execute(f'''
+                    INSERT INTO gpu_samples ({_GPU_SAMPLE_COLUMNS})
+                    SELECT collections.timestamp, {_GPU_SAMPLE_VALUES}
+                    FROM collections, json_each(collections.data, '$.gpus') AS gpu
+                ''')
             
             # Log the schema only in verbose mode
             if self.verbose:
@@ -72,180 +437,326 @@ class Database:
                 logger.info(f"Database schema for collections table:\n{schema[0]}")
             
             # Aggregated data table (1 year retention)
-            self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS aggregated_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    aggregation_time TEXT NOT NULL,
-                    data TEXT NOT NULL,
-                    sent INTEGER DEFAULT 0,
-                    error TEXT
-                )
-            ''')
+            self.conn.execute(_SQL_CREATE_AGGREGATED)
+            self._migrate_time_columns('aggregated_data', _SQL_CREATE_AGGREGATED, ('aggregation_time',))
             
             # Send attempts table
+            self.conn.execute(_SQL_CREATE_SEND_ATTEMPTS)
+            self._migrate_time_columns('send_attempts', _SQL_CREATE_SEND_ATTEMPTS,
+                                       ('aggregation_time', 'timestamp'))
+
+            # Per-aggregation send summary, kept current by a trigger so listing
+            # sends doesn't have to GROUP BY the whole attempt history
+            self.conn.execute(_SQL_CREATE_SEND_SUMMARY)
+            self._migrate_time_columns('send_summary', _SQL_CREATE_SEND_SUMMARY,
+                                       ('aggregation_time', 'first_attempt', 'last_attempt'))
             self.conn.execute('''
-                CREATE TABLE IF NOT EXISTS send_attempts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    aggregation_time TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    success INTEGER DEFAULT 0,
-                    error TEXT,
-                    uid TEXT,
-                    params TEXT,
-                    attempt_number INTEGER DEFAULT 1
+                CREATE TRIGGER IF NOT EXISTS send_attempts_after_insert
+                AFTER INSERT ON send_attempts
+                BEGIN
+                    INSERT INTO send_summary (
+                        aggregation_time, attempts, first_attempt, last_attempt, last_error, uid, sent
+                    ) VALUES (
+                        NEW.aggregation_time, 1, NEW.timestamp, NEW.timestamp,
+                        CASE WHEN NEW.success = 0 THEN NEW.error END,
+                        CASE WHEN NEW.success = 1 THEN NEW.uid END,
+                        CASE WHEN NEW.success = 1 THEN 1 ELSE 0 END
+                    )
+                    ON CONFLICT(aggregation_time) DO UPDATE SET
+                        attempts = attempts + 1,
+                        first_attempt = MIN(first_attempt, excluded.first_attempt),
+                        last_attempt = MAX(last_attempt, excluded.last_attempt),
+                        last_error = COALESCE(excluded.last_error, last_error),
+                        uid = COALESCE(uid, excluded.uid),
+                        sent = MAX(sent, excluded.sent);
+                END
+            ''')
+            # Backfill the summary for attempts recorded before it existed
+            self.conn.execute('''
+                INSERT OR IGNORE INTO send_summary (
+                    aggregation_time, attempts, first_attempt, last_attempt, last_error, uid, sent
                 )
+                SELECT 
+                    aggregation_time,
+                    COUNT(*),
+                    MIN(timestamp),
+                    MAX(timestamp),
+                    MAX(CASE WHEN success = 0 THEN error END),
+                    MAX(CASE WHEN success = 1 THEN uid END),
+                    MAX(CASE WHEN success = 1 THEN 1 ELSE 0 END)
+                FROM send_attempts
+                GROUP BY aggregation_time
             ''')
-    
-    def save_collection(self, data: Dict[str, Any]) -> int:
-        """Save raw GPU metrics collection."""
-        timestamp = datetime.datetime.now().isoformat()
-        data_json = json.dumps(data)
-        
+
+            # Indexes for the time-range and unsent-data lookups
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_collections_ts ON collections(timestamp)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_gpu_samples_uid_ts ON gpu_samples(gpu_uid, ts)')
+            # Retention prunes samples by time alone; without this each batch rescans
+            # the per-GPU index from the start
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_gpu_samples_ts ON gpu_samples(ts)')
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_agg_sent_time ON aggregated_data(sent, aggregation_time)'
+            )
+            # Covers attempt numbering, so its MAX(attempt_number) is a single seek
+            self.conn.execute('DROP INDEX IF EXISTS idx_send_attempts_agg')
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_send_attempts_agg_num '
+                'ON send_attempts(aggregation_time, attempt_number)'
+            )
+
+            # Give the planner statistics for the indexes right away
+            self.conn.execute("ANALYZE")
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _migrate_time_columns(self, table: str, create_sql: str, time_columns: Tuple[str, ...]) -> None:
+        """Rebuild a table whose time columns still store ISO TEXT timestamps.
+
+        Column affinity can't be changed in place, and TEXT affinity would turn
+        the integers back into strings, so the table is copied instead.
+        """
+        columns = [(row['name'], row['type']) for row in self._query(f"PRAGMA table_info({table})")]
+        if not any(name in time_columns and type_.upper() == 'TEXT' for name, type_ in columns):
+            return
         if self.verbose:
-            logger.debug(f"Saving collection to database with timestamp: {timestamp}")
-            logger.debug(f"Data to save: {json.dumps(data, indent=2)}")
+            logger.info(f"Migrating {table} timestamps to epoch microseconds...")
+        names = [name for name, _ in columns]
+        time_indexes = [i for i, name in enumerate(names) if name in time_columns]
+        self.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        self.conn.execute(create_sql)
+        rows = []
+        for row in self.conn.execute(f"SELECT {', '.join(names)} FROM {table}_old"):
+            row = list(row)
+            for i in time_indexes:
+                if row[i] is not None:
+                    row[i] = _to_us(row[i])
+            rows.append(row)
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            rows
+        )
+        self.conn.execute(f"DROP TABLE {table}_old")
+
+    def _migrate_gpu_shape(self) -> None:
+        """Rewrite collections whose gpus are still stored as a dict."""
+        rows = self._query(
+            f"SELECT id, {_DATA_OUT} AS data FROM collections WHERE json_type(data, '$.gpus') = 'object'"
+        ).fetchall()
+        if not rows:
+            return
+        if self.verbose:
+            logger.info(f"Converting {len(rows)} collections to the GPU array format...")
+        self.conn.executemany(
+            f'UPDATE collections SET data = {_DATA_IN} WHERE id = ?',
+            [(_dumps(_normalize_gpus(_loads(row['data']))), row['id']) for row in rows]
+        )
+
+    def save_collection(self, data: Dict[str, Any]) -> Optional[int]:
+        """Save raw GPU metrics collection.
+
+        Returns the row ID if this call flushed the buffer, otherwise None.
+        """
+        timestamp = _now_us()
+        data = _normalize_gpus(data)
+        data_json = _dumps(data)
         
-        with self.conn:
-            cursor = self.conn.execute(
-                'INSERT INTO collections (timestamp, data) VALUES (?, ?)',
-                (timestamp, data_json)
-            )
-            row_id = cursor.lastrowid
-            if self.verbose:
-                logger.debug(f"Successfully saved collection with ID: {row_id}")
+        # Skip formatting the payload unless the debug record will be emitted
+        if self.verbose and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Saving collection to database with timestamp: {_to_iso(timestamp)}")
+            logger.debug(f"Data to save: {data_json}")
+        
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((timestamp, data_json))
+            
+            row_id = None
+            if (len(self._pending) >= self.flush_every_n or
+                    (self.flush_every_sec and
+                     time.monotonic() - self._pending_since >= self.flush_every_sec)):
+                row_id = self.flush()
+                if self.verbose:
+                    logger.debug(f"Successfully saved collection with ID: {row_id}")
             logger.info(f"Saved GPU metrics for {len(data['gpus'])} GPUs")
             return row_id
-    
+
+    def flush(self) -> Optional[int]:
+        """Write buffered collections in a single transaction.
+
+        Returns the row ID of the last collection written, or None if nothing
+        was pending.
+        """
+        with self._lock:
+            if not self._pending:
+                return None
+            rows = self._pending
+            self._pending = []
+            self._pending_since = None
+            try:
+                with self._write_transaction():
+                    self.conn.executemany(_SQL_INSERT_COLLECTION, rows)
+                    row_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    self.conn.executemany(_SQL_INSERT_GPU_SAMPLES, rows)
+            except Exception:
+                # Keep the rows so the next flush retries them
+                self._pending = rows + self._pending
+                self._pending_since = time.monotonic()
+                raise
+            if self.verbose and len(rows) > 1:
+                logger.debug(f"Flushed {len(rows)} buffered collections")
+            return row_id
+
+    def save_collections_batch(self, datas: List[Dict[str, Any]]) -> None:
+        """Save several raw GPU metrics collections in a single transaction."""
+        timestamp = _now_us()
+        rows = [(timestamp, _dumps(_normalize_gpus(data))) for data in datas]
+
+        with self._write_transaction():
+            self.conn.executemany(_SQL_INSERT_COLLECTION, rows)
+            self.conn.executemany(_SQL_INSERT_GPU_SAMPLES, rows)
+        if self.verbose:
+            logger.debug(f"Saved batch of {len(rows)} collections")
+
     def save_aggregated_data(self, data: Dict[str, Any], aggregation_time: str) -> int:
         """Save aggregated GPU metrics."""
-        data_json = json.dumps(data)
-        
-        with self.conn:
-            cursor = self.conn.execute(
-                'INSERT INTO aggregated_data (aggregation_time, data) VALUES (?, ?)',
-                (aggregation_time, data_json)
-            )
-            return cursor.lastrowid
+        data_json = _dumps(data)
+        return self._write(_SQL_INSERT_AGGREGATED, (_to_us(aggregation_time), data_json))
     
     def get_unsent_aggregated_data(self) -> List[Dict[str, Any]]:
         """Get all unsent aggregated data from the last 30 days."""
-        cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
+        cutoff_date = _to_us(datetime.datetime.now() - datetime.timedelta(days=30))
         
-        with self.conn:
-            cursor = self.conn.execute('''
+        with self._lock, self.conn:
+            cursor = self._query('''
                 SELECT id, aggregation_time, data
                 FROM aggregated_data
                 WHERE sent = 0 AND aggregation_time > ?
                 ORDER BY aggregation_time ASC
             ''', (cutoff_date,))
-            return [dict(row) for row in cursor.fetchall()]
+            return [_with_iso_times(row, ('aggregation_time',)) for row in cursor.fetchall()]
     
     def get_collections_for_aggregation(self, start_time: str, end_time: str) -> List[Dict[str, Any]]:
         """Get collections for a specific time range for aggregation."""
-        with self.conn:
-            cursor = self.conn.execute('''
-                SELECT data
+        self.flush()
+        start_us, end_us = _to_us(start_time), _to_us(end_time)
+        with self._lock, self.conn:
+            cursor = self.conn.execute(f'''
+                SELECT {_DATA_OUT} AS data
                 FROM collections
                 WHERE timestamp BETWEEN ? AND ?
                 ORDER BY timestamp ASC
-            ''', (start_time, end_time))
-            return [json.loads(row['data']) for row in cursor.fetchall()]
+            ''', (start_us, end_us))
+            return [_loads(row[0]) for row in cursor.fetchall()]
     
     def mark_aggregated_data_sent(self, data_id: int, success: bool, error: Optional[str] = None) -> None:
         """Mark aggregated data as sent or failed."""
-        with self.conn:
-            if success:
-                self.conn.execute(
-                    'UPDATE aggregated_data SET sent = 1, error = NULL WHERE id = ?',
-                    (data_id,)
-                )
-            else:
-                self.conn.execute(
-                    'UPDATE aggregated_data SET sent = 0, error = ? WHERE id = ?',
-                    (error, data_id)
-                )
+        if success:
+            self._write(
+                'UPDATE aggregated_data SET sent = 1, error = NULL WHERE id = ?',
+                (data_id,)
+            )
+        else:
+            self._write(
+                'UPDATE aggregated_data SET sent = 0, error = ? WHERE id = ?',
+                (error, data_id)
+            )
+    
+    def mark_aggregated_data_sent_bulk(self, data_ids: Sequence[int], success: bool,
+                                       error: Optional[str] = None) -> None:
+        """Mark several aggregated rows as sent or failed in one transaction."""
+        if not data_ids:
+            return
+        if success:
+            sql = 'UPDATE aggregated_data SET sent = 1, error = NULL WHERE id = ?'
+            rows = [(data_id,) for data_id in data_ids]
+        else:
+            sql = 'UPDATE aggregated_data SET sent = 0, error = ? WHERE id = ?'
+            rows = [(error, data_id) for data_id in data_ids]
+        with self._write_transaction():
+            self.conn.executemany(sql, rows)
     
     def record_send_attempt(self, aggregation_time: str, success: bool, error: Optional[str] = None,
                           uid: Optional[str] = None, params: Optional[str] = None) -> None:
         """Record a send attempt."""
-        timestamp = datetime.datetime.now().isoformat()
+        aggregation_us = _to_us(aggregation_time)
         
-        with self.conn:
-            # Get attempt number
-            cursor = self.conn.execute('''
-                SELECT MAX(attempt_number) as max_attempt
-                FROM send_attempts
-                WHERE aggregation_time = ?
-            ''', (aggregation_time,))
-            row = cursor.fetchone()
-            attempt_number = (row['max_attempt'] or 0) + 1
-            
-            # Insert attempt
-            self.conn.execute('''
-                INSERT INTO send_attempts (
-                    aggregation_time, timestamp, success, error, uid, params, attempt_number
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (aggregation_time, timestamp, success, error, uid, params, attempt_number))
+        # Insert attempt, numbering it after the previous attempts in the same statement
+        self._write(
+            _SQL_INSERT_SEND_ATTEMPT,
+            (aggregation_us, _now_us(), success, error, uid, params, aggregation_us)
+        )
+    
+    def record_send_attempts_bulk(self, attempts: Sequence[Tuple[Any, ...]]) -> None:
+        """Record several send attempts in one transaction.
+
+        Each attempt is an (aggregation_time, timestamp, success, error, uid, params)
+        tuple; timestamp is when the attempt was made.
+        """
+        rows = []
+        for aggregation_time, timestamp, success, error, uid, params in attempts:
+            aggregation_us = _to_us(aggregation_time)
+            rows.append((aggregation_us, _to_us(timestamp), success, error, uid, params, aggregation_us))
+        if not rows:
+            return
+        
+        # Rows are numbered in order, each seeing the attempts inserted before it
+        with self._write_transaction():
+            self.conn.executemany(_SQL_INSERT_SEND_ATTEMPT, rows)
     
     def get_send_attempts(self, aggregation_time: str) -> List[Dict[str, Any]]:
         """Get all send attempts for a specific aggregation time."""
-        with self.conn:
-            cursor = self.conn.execute('''
+        with self._lock, self.conn:
+            cursor = self._query('''
                 SELECT *
                 FROM send_attempts
                 WHERE aggregation_time = ?
                 ORDER BY timestamp ASC
-            ''', (aggregation_time,))
-            return [dict(row) for row in cursor.fetchall()]
+            ''', (_to_us(aggregation_time),))
+            return [_with_iso_times(row, ('aggregation_time', 'timestamp')) for row in cursor.fetchall()]
+    
+    def count_send_attempts(self, aggregation_time: str) -> int:
+        """Count send attempts for an aggregation time without reading them."""
+        with self._lock, self.conn:
+            # The trigger-maintained summary holds the count under the primary key
+            row = self.conn.execute(
+                'SELECT attempts FROM send_summary WHERE aggregation_time = ?',
+                (_to_us(aggregation_time),)
+            ).fetchone()
+            return row[0] if row else 0
     
     def get_all_sends(self) -> List[Dict[str, Any]]:
         """Get all send attempts with summary information."""
-        with self.conn:
-            cursor = self.conn.execute('''
-                SELECT 
-                    aggregation_time,
-                    COUNT(*) as attempts,
-                    MIN(timestamp) as first_attempt,
-                    MAX(timestamp) as last_attempt,
-                    MAX(CASE WHEN success = 0 THEN error END) as last_error,
-                    MAX(CASE WHEN success = 1 THEN uid END) as uid,
-                    MAX(CASE WHEN success = 1 THEN 1 ELSE 0 END) as sent
-                FROM send_attempts
-                GROUP BY aggregation_time
+        with self._lock, self.conn:
+            cursor = self._query('''
+                SELECT aggregation_time, attempts, first_attempt, last_attempt, last_error, uid, sent
+                FROM send_summary
                 ORDER BY aggregation_time DESC
             ''')
-            return [dict(row) for row in cursor.fetchall()]
+            return [_with_iso_times(row, _SUMMARY_TIME_COLUMNS) for row in cursor.fetchall()]
     
     def get_send_by_time(self, aggregation_time: str) -> Optional[Dict[str, Any]]:
         """Get send attempt summary for a specific aggregation time."""
-        with self.conn:
-            cursor = self.conn.execute('''
-                SELECT 
-                    aggregation_time,
-                    COUNT(*) as attempts,
-                    MIN(timestamp) as first_attempt,
-                    MAX(timestamp) as last_attempt,
-                    MAX(CASE WHEN success = 0 THEN error END) as last_error,
-                    MAX(CASE WHEN success = 1 THEN uid END) as uid,
-                    MAX(CASE WHEN success = 1 THEN 1 ELSE 0 END) as sent
-                FROM send_attempts
+        with self._lock, self.conn:
+            cursor = self._query('''
+                SELECT aggregation_time, attempts, first_attempt, last_attempt, last_error, uid, sent
+                FROM send_summary
                 WHERE aggregation_time = ?
-                GROUP BY aggregation_time
-            ''', (aggregation_time,))
+            ''', (_to_us(aggregation_time),))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return _with_iso_times(row, _SUMMARY_TIME_COLUMNS) if row else None
     
     def get_collection_by_time(self, timestamp: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get raw collection data for a specific timestamp or current hour if no timestamp provided."""
-        with self.conn:
+        self.flush()
+        with self._lock, self.conn:
             if timestamp is None:
                 # Get current hour's data
                 current_time = datetime.datetime.now()
-                start_time = current_time.replace(minute=0, second=0, microsecond=0).isoformat()
-                end_time = current_time.replace(minute=59, second=59, microsecond=999999).isoformat()
+                start_time = current_time.replace(minute=0, second=0, microsecond=0)
+                end_time = current_time.replace(minute=59, second=59, microsecond=999999)
                 
-                if self.verbose:
-                    logger.debug(f"Querying collections between {start_time} and {end_time}")
+                if self.verbose and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Querying collections between {start_time.isoformat()} and {end_time.isoformat()}")
+                start_time, end_time = _to_us(start_time), _to_us(end_time)
                 
                 # First check if we have any data in this range
                 cursor = self.conn.execute('''
@@ -253,32 +764,25 @@ class Database:
                     FROM collections
                     WHERE timestamp BETWEEN ? AND ?
                 ''', (start_time, end_time))
-                count = cursor.fetchone()['count']
+                count = cursor.fetchone()[0]
                 
                 if count == 0:
                     # If no data found in current hour, get the most recent data
                     if self.verbose:
                         logger.debug("No data found in current hour, showing most recent data")
-                    cursor = self.conn.execute('''
-                        SELECT timestamp, data
+                    cursor = self._query(f'''
+                        SELECT timestamp, {_DATA_OUT} AS data
                         FROM collections
                         ORDER BY timestamp DESC
                         LIMIT 1
                     ''')
                     latest = cursor.fetchone()
                     if latest:
-                        data = json.loads(latest['data'])
-                        if isinstance(data.get('gpus'), dict):
-                            gpus_array = []
-                            for gpu_id, gpu_data in data['gpus'].items():
-                                gpu_data['uid'] = f"gpu_{gpu_id}_{gpu_data['name'].replace(' ', '_')}"
-                                gpus_array.append(gpu_data)
-                            data['gpus'] = gpus_array
-                        return [{'timestamp': latest['timestamp'], **data}]
+                        return [{'timestamp': _to_iso(latest['timestamp']), **_loads(latest['data'])}]
                     return []
                 
-                cursor = self.conn.execute('''
-                    SELECT timestamp, data
+                cursor = self._query(f'''
+                    SELECT timestamp, {_DATA_OUT} AS data
                     FROM collections
                     WHERE timestamp BETWEEN ? AND ?
                     ORDER BY timestamp ASC
@@ -287,24 +791,17 @@ class Database:
                 # Get data for specific timestamp
                 if self.verbose:
                     logger.debug(f"Querying collections for timestamp {timestamp}")
-                cursor = self.conn.execute('''
-                    SELECT timestamp, data
+                cursor = self._query(f'''
+                    SELECT timestamp, {_DATA_OUT} AS data
                     FROM collections
                     WHERE timestamp = ?
                     ORDER BY timestamp ASC
-                ''', (timestamp,))
+                ''', (_to_us(timestamp),))
             
             results = []
+            # Stored collections always use the GPU array format
             for row in cursor.fetchall():
-                data = json.loads(row['data'])
-                # Convert old dictionary format to new array format
-                if isinstance(data.get('gpus'), dict):
-                    gpus_array = []
-                    for gpu_id, gpu_data in data['gpus'].items():
-                        gpu_data['uid'] = f"gpu_{gpu_id}_{gpu_data['name'].replace(' ', '_')}"
-                        gpus_array.append(gpu_data)
-                    data['gpus'] = gpus_array
-                results.append({'timestamp': row['timestamp'], **data})
+                results.append({'timestamp': _to_iso(row['timestamp']), **_loads(row['data'])})
             
             if self.verbose:
                 logger.debug(f"Found {len(results)} collections")
@@ -312,65 +809,113 @@ class Database:
     
     def cleanup_old_data(self) -> None:
         """Clean up old data based on retention policies."""
+        self.flush()
+        now = datetime.datetime.now()
+        
         # Keep raw collections for 30 days
-        collections_cutoff = (datetime.datetime.now() - datetime.timedelta(days=30)).isoformat()
+        collections_cutoff = _to_us(now - datetime.timedelta(days=30))
         
         # Keep aggregated data for 1 year
-        aggregated_cutoff = (datetime.datetime.now() - datetime.timedelta(days=365)).isoformat()
+        aggregated_cutoff = _to_us(now - datetime.timedelta(days=365))
         
-        with self.conn:
-            # Delete old collections
-            self.conn.execute(
-                'DELETE FROM collections WHERE timestamp < ?',
-                (collections_cutoff,)
-            )
-            
-            # Delete old aggregated data
-            self.conn.execute(
-                'DELETE FROM aggregated_data WHERE aggregation_time < ?',
-                (aggregated_cutoff,)
-            )
-            
-            # Delete send attempts for deleted data
-            self.conn.execute('''
-                DELETE FROM send_attempts
-                WHERE aggregation_time < ?
-            ''', (aggregated_cutoff,))
+        # Delete old collections
+        self._delete_in_batches('collections', 'timestamp', collections_cutoff)
+        self._delete_in_batches('gpu_samples', 'ts', collections_cutoff)
+        
+        # Delete old aggregated data
+        self._delete_in_batches('aggregated_data', 'aggregation_time', aggregated_cutoff)
+        
+        # Delete send attempts for deleted data
+        self._delete_in_batches('send_attempts', 'aggregation_time', aggregated_cutoff)
+        self._delete_in_batches('send_summary', 'aggregation_time', aggregated_cutoff)
+    
+    def _delete_in_batches(self, table: str, column: str, cutoff: Any) -> int:
+        """Delete rows with column < cutoff in short transactions; return the count."""
+        sql = f'''
+            DELETE FROM {table}
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE {column} < ? LIMIT {_RETENTION_BATCH_SIZE})
+        '''
+        total = 0
+        while not self._retention_stop.is_set():
+            with self._write_transaction():
+                deleted = self.conn.execute(sql, (cutoff,)).rowcount
+            total += deleted
+            if deleted < _RETENTION_BATCH_SIZE:
+                break
+        return total
+    
+    def start_retention(self, interval: float = 3600.0) -> None:
+        """Run cleanup_old_data every interval seconds on a background thread."""
+        if self._retention_thread is not None:
+            return
+        self._retention_thread = threading.Thread(
+            target=self._retention_loop, args=(interval,), name='gpu-monitor-retention', daemon=True
+        )
+        self._retention_thread.start()
+    
+    def _retention_loop(self, interval: float) -> None:
+        """Apply the retention policies until the database is closed."""
+        while not self._retention_stop.wait(interval):
+            try:
+                self.cleanup_old_data()
+            except Exception as e:
+                logger.error(f"Failed to clean up old data: {str(e)}")
     
     def close(self) -> None:
-        """Close database connection."""
-        self.conn.close()
+        """Flush buffered collections and close database connection."""
+        # Stop the retention thread first; it needs the lock to finish a batch
+        self._retention_stop.set()
+        if self._retention_thread is not None:
+            self._retention_thread.join()
+            self._retention_thread = None
+        with self._write_queue_lock:
+            if not self._write_queue_closed:
+                self._write_queue_closed = True
+                self._write_queue.put(None)
+        self._writer_thread.join()
+        with self._lock:
+            try:
+                self.flush()
+                # Persist query planner statistics for the next run
+                self.conn.execute("PRAGMA optimize")
+            finally:
+                self.conn.close()
     
-    def __del__(self):
-        """Cleanup resources."""
+    def __enter__(self) -> 'Database':
+        """Use the database as a context manager."""
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        """Close the database when leaving the context."""
         self.close()
 
     def check_database_contents(self) -> None:
         """Check and log all contents of the collections table."""
-        with self.conn:
+        self.flush()
+        with self._lock, self.conn:
             cursor = self.conn.execute('SELECT COUNT(*) as count FROM collections')
-            total_count = cursor.fetchone()['count']
+            total_count = cursor.fetchone()[0]
             if self.verbose:
                 logger.debug(f"Total collections in database: {total_count}")
             
             if total_count > 0:
-                cursor = self.conn.execute('''
-                    SELECT id, timestamp, data
-                    FROM collections
-                    ORDER BY timestamp DESC
-                    LIMIT 5
-                ''')
-                recent_collections = cursor.fetchall()
-                if self.verbose:
+                if not self.verbose:
+                    logger.info(f"Found {total_count} collections in database")
+                elif logger.isEnabledFor(logging.DEBUG):
+                    # Only read and pretty-print rows when the debug records will be emitted
+                    cursor = self._query(f'''
+                        SELECT id, timestamp, {_DATA_OUT} AS data
+                        FROM collections
+                        ORDER BY timestamp DESC
+                        LIMIT 5
+                    ''')
                     logger.debug("Most recent collections (raw data):")
-                    for row in recent_collections:
+                    for row in cursor.fetchall():
                         logger.debug(f"ID: {row['id']}")
-                        logger.debug(f"Timestamp: {row['timestamp']}")
+                        logger.debug(f"Timestamp: {_to_iso(row['timestamp'])}")
                         logger.debug(f"Raw data: {row['data']}")
                         try:
-                            data = json.loads(row['data'])
+                            data = _loads(row['data'])
                             logger.debug(f"Parsed data: {json.dumps(data, indent=2)}")
                         except json.JSONDecodeError:
                             logger.error(f"Failed to parse data for ID {row['id']}")
-                else:
-                    logger.info(f"Found {total_count} collections in database")
@@ -17,9 +17,13 @@
 import os
 import sys
 import logging
+import logging.handlers
 from datetime import datetime
 from typing import Optional
 
+# Debug file output is buffered and written in blocks of this many records
+LOG_BUFFER_CAPACITY = 256
+
 # Platform-specific color support
 if sys.platform == 'win32':
     try:
@@ -57,35 +61,49 @@ def setup_logging(log_file: str, level: str = 'INFO', verbose: bool = False) ->
     if verbose:
         log_level = logging.DEBUG
 
+    log_format = '%(asctime)s - %(levelname)s - %(message)s'
+    file_handler = logging.FileHandler(log_file)
+    if log_level <= logging.DEBUG:
+        # Debug output is chatty enough that a write per record adds up;
+        # a warning or worse writes it out at once, with the context before it
+        file_handler.setFormatter(logging.Formatter(log_format))
+        file_handler = logging.handlers.MemoryHandler(
+            LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=file_handler
+        )
+
     logging.basicConfig(
         level=log_level,
-        format='%(asctime)s - %(levelname)s - %(message)s',
+        format=log_format,
         handlers=[
-            logging.FileHandler(log_file),
+            file_handler,
             logging.StreamHandler()
         ]
     )
 
+def flush_logging() -> None:
+    """Write out any buffered log records."""
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+# Colour and logger method per level, resolved once instead of on every call
+_ROOT_LOGGER = logging.getLogger()
+_LEVELS = {
+    'DEBUG': (Fore.CYAN, _ROOT_LOGGER.debug),
+    'INFO': (Fore.GREEN, _ROOT_LOGGER.info),
+    'WARNING': (Fore.YELLOW, _ROOT_LOGGER.warning),
+    'ERROR': (Fore.RED, _ROOT_LOGGER.error),
+    'CRITICAL': (Fore.RED + Style.BRIGHT, _ROOT_LOGGER.critical)
+}
+_DEFAULT_LEVEL = (Fore.WHITE, _ROOT_LOGGER.info)
+
+# Only colour output going to a terminal; pipes and redirects get plain text
+_COLORIZE = sys.platform != 'win32' and sys.stderr is not None and sys.stderr.isatty()
+
 def log_message(message: str, level: str = 'info', verbose: bool = False) -> None:
     """Log a message with color-coded output."""
-    level = level.upper()
-    logger = logging.getLogger()
-    
-    # Get color based on level
-    color = {
-        'DEBUG': Fore.CYAN,
-        'INFO': Fore.GREEN,
-        'WARNING': Fore.YELLOW,
-        'ERROR': Fore.RED,
-        'CRITICAL': Fore.RED + Style.BRIGHT
-    }.get(level, Fore.WHITE)
-    
-    # Log with color
-    if sys.platform != 'win32':
+    color, log_func = _LEVELS.get(level.upper(), _DEFAULT_LEVEL)
+    if _COLORIZE:
         message = f"{color}{message}{Style.RESET_ALL}"
-    
-    # Log to appropriate level
-    log_func = getattr(logger, level.lower(), logger.info)
     log_func(message)
 
 def log_offline_mode(verbose: bool = False) -> None:
@@ -18,111 +18,104 @@ import time
 import signal
 import sys
 import csv
+import io
 import json
 import os
-from typing import Dict, Any, List
-from .config import parse_args, get_config
-from .logging import setup_logging, log_message
+import argparse
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import FrameType
+from typing import Dict, Any, List, Optional, TextIO
+from .config import parse_args, get_config, DEFAULT_INTERVALS
+from .logging import setup_logging, log_message, flush_logging
 from .db import Database
 from .nvml import initialize_nvml, get_gpu_info, shutdown_nvml
-from .server import ServerClient
+from .server import ServerClient, _close_session
 
-def format_collection_data(data, format_type='json'):  # type: (List[Dict[str, Any]], str) -> str
-    """Format collection data in the specified format."""
+def write_collection_data(data, out, format_type='json'):  # type: (List[Dict[str, Any]], TextIO, str) -> None
+    """Write collection data in the specified format to a text stream."""
     if format_type == 'csv':
         if not data:
-            return "No data available"
+            out.write("No data available\n")
+            return
         
         # Get fieldnames from first GPU entry
         fieldnames = ['timestamp']
-        if data and data[0].get('gpus'):
+        if data[0].get('gpus'):
             fieldnames.extend(data[0]['gpus'][0].keys())
         
-        # Create CSV output
-        output = []
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        # Rows go straight to the stream instead of being collected first
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
         writer.writeheader()
-        
         for entry in data:
             timestamp = entry['timestamp']
-            for gpu in entry['gpus']:
-                row = {'timestamp': timestamp}
-                row.update(gpu)
-                writer.writerow(row)
-        
-        return '\n'.join(output)
+            writer.writerows({'timestamp': timestamp, **gpu} for gpu in entry['gpus'])
     else:  # json
-        return json.dumps(data, indent=2)
+        json.dump(data, out, indent=2)
+        out.write('\n')
 
-def main():
-    """Main entry point."""
-    # Parse command line arguments
-    args = parse_args()
-    
-    # Load configuration
-    config = get_config(args)
-    
-    # Ensure run directory exists
-    run_dir = os.path.dirname(config['paths']['log'])
-    if not os.path.exists(run_dir):
-        os.makedirs(run_dir)
-    
-    # Setup logging
-    setup_logging(
-        config['paths']['log'],
-        level=config['logging']['level'],
-        verbose=args.verbose
-    )
-    if args.verbose:
-        log_message("Starting GPU Monitor", level='INFO')
-    
-    # Initialize database
-    db = Database(config['paths']['database'], verbose=args.verbose)
-    
-    # Handle special commands
-    if args.list_sends or args.search_send or args.show_collection is not None:
-        # Database-only mode
-        if args.list_sends:
-            sends = db.get_all_sends()
-            if not sends:
-                print("No send attempts found")
-                return
-            
-            print("\nSend Attempts:")
-            print("Aggregation Time | Attempts | First Attempt | Last Attempt | Last Error | UID | Sent")
-            for send in sends:
-                print(f"{send['aggregation_time']} | {send['attempts']} | {send['first_attempt']} | {send['last_attempt']} | {send['last_error']} | {send['uid']} | {send['sent']}")
+def format_collection_data(data, format_type='json'):  # type: (List[Dict[str, Any]], str) -> str
+    """Format collection data in the specified format."""
+    buf = io.StringIO()
+    write_collection_data(data, buf, format_type)
+    return buf.getvalue()
+
+# Number of collections buffered before they are written in one transaction
+COLLECTION_BATCH_SIZE = 10
+
+def _handle_sigterm(signum, frame):  # type: (int, Optional[FrameType]) -> None
+    """Turn SIGTERM into the same clean shutdown as Ctrl+C."""
+    raise KeyboardInterrupt
+
+def _log_write_error(future):  # type: (Future) -> None
+    """Log the failure of a background database write."""
+    error = future.exception()
+    if error is not None:
+        log_message(f"Failed to save GPU metrics: {str(error)}", level='ERROR')
+
+def run_database_command(args, db):  # type: (argparse.Namespace, Database) -> None
+    """Run one of the database-only CLI commands."""
+    if args.list_sends:
+        sends = db.get_all_sends()
+        if not sends:
+            print("No send attempts found")
             return
         
-        if args.search_send:
-            send = db.get_send_by_time(args.search_send)
-            if not send:
-                print(f"No send attempt found for {args.search_send}")
-                return
-            
-            print("\nSend Attempt Details:")
-            print(f"Aggregation Time: {send['aggregation_time']}")
-            print(f"Attempts: {send['attempts']}")
-            print(f"First Attempt: {send['first_attempt']}")
-            print(f"Last Attempt: {send['last_attempt']}")
-            print(f"Last Error: {send['last_error']}")
-            print(f"UID: {send['uid']}")
-            print(f"Sent: {send['sent']}")
+        print("\nSend Attempts:")
+        print("Aggregation Time | Attempts | First Attempt | Last Attempt | Last Error | UID | Sent")
+        for send in sends:
+            print(f"{send['aggregation_time']} | {send['attempts']} | {send['first_attempt']} | {send['last_attempt']} | {send['last_error']} | {send['uid']} | {send['sent']}")
+        return
+    
+    if args.search_send:
+        send = db.get_send_by_time(args.search_send)
+        if not send:
+            print(f"No send attempt found for {args.search_send}")
             return
         
-        if args.show_collection is not None:
-            # If show_collection is empty string, it means show current hour
-            timestamp = None if args.show_collection == "" else args.show_collection
-            collection_data = db.get_collection_by_time(timestamp)
-            if collection_data:
-                print(format_collection_data(collection_data, args.output_format))
-            else:
-                print(f"No collection data found for {timestamp if timestamp else 'current hour'}")
-                if args.verbose:
-                    db.check_database_contents()
-            return
+        print("\nSend Attempt Details:")
+        print(f"Aggregation Time: {send['aggregation_time']}")
+        print(f"Attempts: {send['attempts']}")
+        print(f"First Attempt: {send['first_attempt']}")
+        print(f"Last Attempt: {send['last_attempt']}")
+        print(f"Last Error: {send['last_error']}")
+        print(f"UID: {send['uid']}")
+        print(f"Sent: {send['sent']}")
+        return
     
-    # If we get here, we're in normal collection mode
+    if args.show_collection is not None:
+        # If show_collection is empty string, it means show current hour
+        timestamp = None if args.show_collection == "" else args.show_collection
+        collection_data = db.get_collection_by_time(timestamp)
+        if collection_data:
+            write_collection_data(collection_data, sys.stdout, args.output_format)
+        else:
+            print(f"No collection data found for {timestamp if timestamp else 'current hour'}")
+            if args.verbose:
+                db.check_database_contents()
+        return
+
+def run_collection(args, config, db):  # type: (argparse.Namespace, Dict[str, Any], Database) -> None
+    """Collect GPU metrics until interrupted."""
     # Initialize NVML
     try:
         initialize_nvml(verbose=args.verbose)
@@ -138,26 +131,88 @@ def main():
         verbose=args.verbose
     )
     
-    # Main loop
+    # Make sure buffered collections are flushed when the service is stopped
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    
+    # Database writes run on a single background thread so a slow commit
+    # doesn't hold up the next poll
+    writer = ThreadPoolExecutor(max_workers=1)
+    
+    # Old data is pruned in the background; the thread stops when db is closed
+    db.start_retention(config['intervals'].get('retention', DEFAULT_INTERVALS['retention']))
+    
+    # Main loop; polls are scheduled on a monotonic deadline so the time spent
+    # collecting doesn't push every later poll back
+    interval = config['intervals']['collection']
+    next_deadline = time.monotonic()
     try:
         while True:
             # Collect GPU metrics
             try:
                 gpu_info = get_gpu_info(verbose=args.verbose)
-                db.save_collection(gpu_info)
+                writer.submit(db.save_collection, gpu_info).add_done_callback(_log_write_error)
                 log_message("GPU metrics collected", level='DEBUG')
             except Exception as e:
                 log_message(f"Failed to collect GPU metrics: {str(e)}", level='ERROR')
             
             # Sleep until next collection
-            time.sleep(config['intervals']['collection'])
+            next_deadline += interval
+            delay = next_deadline - time.monotonic()
+            if delay < 0:
+                # Overran the interval: resume at the next aligned slot instead of catching up
+                missed = int(-delay // interval) + 1
+                log_message(f"Collection overran its {interval}s interval, skipping {missed} poll(s)",
+                            level='WARNING')
+                next_deadline += missed * interval
+                delay = next_deadline - time.monotonic()
+            time.sleep(max(0.0, delay))
             
     except KeyboardInterrupt:
         log_message("Shutting down...", level='INFO')
     finally:
+        writer.shutdown(wait=True)
+        server.close()
+        _close_session()
         shutdown_nvml()
-        db.close()
         log_message("Shutdown complete", level='INFO')
 
+def main():
+    """Main entry point."""
+    # Parse command line arguments
+    args = parse_args()
+    
+    # Load configuration
+    config = get_config(args)
+    
+    # Ensure run directory exists
+    run_dir = os.path.dirname(config['paths']['log'])
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+    
+    # Setup logging
+    setup_logging(
+        config['paths']['log'],
+        level=config['logging']['level'],
+        verbose=args.verbose
+    )
+    if args.verbose:
+        log_message("Starting GPU Monitor", level='INFO')
+    
+    # Initialize database; it is flushed and closed when we leave the block
+    flush_interval = config['intervals'].get('flush', DEFAULT_INTERVALS['flush'])
+    try:
+        with Database(config['paths']['database'], verbose=args.verbose,
+                      flush_every_n=COLLECTION_BATCH_SIZE, flush_every_sec=flush_interval) as db:
+            # Handle special commands
+            if args.list_sends or args.search_send or args.show_collection is not None:
+                # Database-only mode
+                run_database_command(args, db)
+                return
+            
+            run_collection(args, config, db)
+    finally:
+        # Debug logs are buffered; make sure the tail reaches the log file
+        flush_logging()
+
 if __name__ == '__main__':
     main()
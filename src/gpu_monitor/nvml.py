@@ -16,9 +16,50 @@
 # gpu_monitor/nvml.py
 import sys
 import pynvml
-from typing import Dict, Any
+from typing import Dict, Any, List
 from .logging import log_message
 
+# Device handles and attributes that never change, resolved once per NVML session
+_DEVICES = []  # type: List[Dict[str, Any]]
+
+# Optional metrics, probed once per device; datacenter cards often have no fan
+_CAP_FAN = 1 << 0
+_CAP_CLOCKS = 1 << 1
+
+def _probe_capabilities(handle: Any) -> int:
+    """Return a bitmask of the optional metrics the device can report."""
+    capabilities = 0
+    try:
+        pynvml.nvmlDeviceGetFanSpeed(handle)
+        capabilities |= _CAP_FAN
+    except pynvml.NVMLError:
+        pass
+    try:
+        pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_GRAPHICS)
+        pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM)
+        capabilities |= _CAP_CLOCKS
+    except pynvml.NVMLError:
+        pass
+    return capabilities
+
+def _discover_devices() -> List[Dict[str, Any]]:
+    """Resolve handles and static attributes for every GPU."""
+    devices = []
+    for i in range(pynvml.nvmlDeviceGetCount()):
+        handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+        devices.append({
+            "index": i,
+            "handle": handle,
+            # nvidia-ml-py returns str from its string getters and struct fields
+            "uid": pynvml.nvmlDeviceGetUUID(handle),
+            # Use busId directly as it's the most reliable PCI identifier
+            "pci_bus_id": pynvml.nvmlDeviceGetPciInfo(handle).busId,
+            "name": pynvml.nvmlDeviceGetName(handle),
+            "memory_total": pynvml.nvmlDeviceGetMemoryInfo(handle).total,
+            "capabilities": _probe_capabilities(handle),
+        })
+    return devices
+
 def initialize_nvml(verbose: bool = False) -> None:
     """Initialize NVML library."""
     if sys.platform == 'darwin':
@@ -27,6 +68,7 @@ def initialize_nvml(verbose: bool = False) -> None:
 
     try:
         pynvml.nvmlInit()
+        _DEVICES[:] = _discover_devices()
         log_message("NVML initialized successfully", verbose=verbose)
     except pynvml.NVMLError as e:
         log_message(f"Failed to initialize NVML: {str(e)}", level='error', verbose=verbose)
@@ -37,44 +79,38 @@ def get_gpu_info(verbose: bool = False) -> Dict[str, Any]:
     gpu_info = {"gpus": []}
     
     try:
-        device_count = pynvml.nvmlDeviceGetCount()
+        if not _DEVICES:
+            _DEVICES[:] = _discover_devices()
         if verbose:
-            log_message(f"Found {device_count} GPU(s)", level='DEBUG')
+            log_message(f"Found {len(_DEVICES)} GPU(s)", level='DEBUG')
         
-        for i in range(device_count):
-            handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-            name = pynvml.nvmlDeviceGetName(handle)
+        for device in _DEVICES:
+            i = device["index"]
+            handle = device["handle"]
             if verbose:
-                log_message(f"GPU {i}: {name}", level='DEBUG')
+                log_message(f"GPU {i}: {device['name']}", level='DEBUG')
             
             # Get GPU metrics
             temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
             memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
             utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
             power = pynvml.nvmlDeviceGetPowerUsage(handle) / 1000.0  # Convert to watts
-            fan = pynvml.nvmlDeviceGetFanSpeed(handle)
-            graphics_clock = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_GRAPHICS)
-            memory_clock = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM)
-            
-            # Get GPU UUID
-            gpu_uuid = pynvml.nvmlDeviceGetUUID(handle)
-            gpu_uuid = gpu_uuid.decode('utf-8') if isinstance(gpu_uuid, bytes) else str(gpu_uuid)
-            
-            # Get PCI info
-            pci_info = pynvml.nvmlDeviceGetPciInfo(handle)
-            # Use busId directly as it's the most reliable PCI identifier
-            pci_bus_id = pci_info.busId.decode('utf-8') if isinstance(pci_info.busId, bytes) else str(pci_info.busId)
-            
-            # Convert name to string if it's bytes
-            gpu_name = name.decode('utf-8') if isinstance(name, bytes) else str(name)
+            # Unsupported metrics are reported as None rather than probed every poll
+            capabilities = device["capabilities"]
+            fan = pynvml.nvmlDeviceGetFanSpeed(handle) if capabilities & _CAP_FAN else None
+            if capabilities & _CAP_CLOCKS:
+                graphics_clock = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_GRAPHICS)
+                memory_clock = pynvml.nvmlDeviceGetClockInfo(handle, pynvml.NVML_CLOCK_MEM)
+            else:
+                graphics_clock = memory_clock = None
             
             gpu_info["gpus"].append({
-                "uid": gpu_uuid,
-                "pci_bus_id": pci_bus_id,
-                "name": gpu_name,
+                "uid": device["uid"],
+                "pci_bus_id": device["pci_bus_id"],
+                "name": device["name"],
                 "temperature": temp,
                 "memory_used": memory.used,
-                "memory_total": memory.total,
+                "memory_total": device["memory_total"],
                 "gpu_utilization": utilization.gpu,
                 "memory_utilization": utilization.memory,
                 "power_usage": power,
@@ -84,7 +120,7 @@ def get_gpu_info(verbose: bool = False) -> Dict[str, Any]:
             })
             
             if verbose:
-                log_message(f"GPU {i} PCI Bus ID: {pci_bus_id}", level='DEBUG')
+                log_message(f"GPU {i} PCI Bus ID: {device['pci_bus_id']}", level='DEBUG')
         
         return gpu_info
         
@@ -98,6 +134,8 @@ def shutdown_nvml(verbose: bool = False) -> None:
         return
 
     try:
+        # Handles are invalid once NVML is shut down
+        _DEVICES.clear()
         pynvml.nvmlShutdown()
         log_message("NVML shutdown successfully", verbose=verbose)
     except pynvml.NVMLError as e:
@@ -16,14 +16,84 @@
 # gpu_monitor/server.py
 import sys
 import json
+import hashlib
 import time
-import requests
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Dict, Any, Tuple, Optional, List
 from .logging import log_message
 from .db import Database
 from datetime import datetime
 
+# Upper bound on concurrent sends when draining the backlog
+SEND_WORKERS = 8
+# Backlog rows handed to the pool at a time, so only this many sends are queued
+SEND_CHUNK_SIZE = SEND_WORKERS * 8
+# Pooled keep-alive connections per host; at least one per send worker so
+# concurrent sends never open and discard overflow connections
+HTTP_POOL_SIZE = 16
+
+# Transient gateway errors are retried in-request with exponential backoff
+# before counting as a failed attempt. urllib3 retries the first time at once
+# and then waits 2s and 4s (plus up to 1s of jitter where supported).
+# Connection and read errors are not: the server may already have stored a
+# POST it was slow to answer, and retrying it would insert it twice
+SEND_RETRIES = 3
+SEND_BACKOFF_FACTOR = 1.0
+_RETRY_STATUSES = (502, 503, 504)
+
+# One HTTP session for every client so sends reuse pooled keep-alive connections
+_SESSION = None  # type: Optional[Any]
+_SESSION_LOCK = threading.Lock()
+
+def _make_retry() -> Any:
+    """Build the urllib3 retry policy for sends."""
+    from urllib3.util.retry import Retry
+    kwargs = dict(
+        total=SEND_RETRIES,
+        connect=0,
+        read=0,
+        backoff_factor=SEND_BACKOFF_FACTOR,
+        status_forcelist=_RETRY_STATUSES,
+        # The final error response is returned so send_data can record it
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=frozenset(['POST']), backoff_jitter=1.0, **kwargs)
+    except TypeError:
+        # urllib3 < 2.0 has no jitter, and < 1.26 names the method filter differently
+        try:
+            return Retry(allowed_methods=frozenset(['POST']), **kwargs)
+        except TypeError:
+            return Retry(method_whitelist=frozenset(['POST']), **kwargs)
+
+def _get_session() -> Any:
+    """Return the shared requests.Session, creating it on first use."""
+    global _SESSION
+    # requests is imported on first use so offline runs never pay for it
+    import requests
+    from requests.adapters import HTTPAdapter
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            # Every payload is JSON, so set it once instead of merging it per request
+            session.headers['Content-Type'] = 'application/json'
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                  max_retries=_make_retry())
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSION = session
+        return _SESSION
+
+def _close_session() -> None:
+    """Close the shared HTTP session; the next send opens a new one."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
+
 class ServerClient:
     """Client for communicating with the metrics server."""
     
@@ -33,12 +103,11 @@ class ServerClient:
         self.contract_number = contract_number
         self.offline = offline
         self.verbose = verbose
-        self.session = requests.Session()
+        # Offline clients never send, so they don't need HTTP at all
+        self.session = None if offline else _get_session()
         self.timeout = 30  # 30 seconds timeout
-        self.headers = {
-            'Content-Type': 'application/json',
-            'X-Contract-Number': contract_number
-        }
+        # The session is shared across contracts, so only this header is per client
+        self.headers = {'X-Contract-Number': contract_number}
         self.max_retries = 10  # Maximum number of retry attempts
     
     def send_data(self, data: Dict[str, Any], aggregation_time: str, db: Database) -> Tuple[bool, Optional[str]]:
@@ -46,10 +115,11 @@ class ServerClient:
         if not self.url or self.offline:
             log_message("Server URL not configured or in offline mode, skipping send", level='warning', verbose=self.verbose)
             return True, None
+        import requests
         
-        # Get previous attempts
-        attempts = db.get_send_attempts(aggregation_time)
-        if len(attempts) >= self.max_retries:
+        # Count previous attempts
+        attempt_count = db.count_send_attempts(aggregation_time)
+        if attempt_count >= self.max_retries:
             error = f"Maximum retry attempts ({self.max_retries}) reached"
             log_message(error, level='error', verbose=self.verbose)
             return False, error
@@ -58,12 +128,19 @@ class ServerClient:
             # Add contract number to data
             data['contract_number'] = self.contract_number
             
+            # Serialize once for the request body, the log line and the attempt record
+            payload = json.dumps(data)
+            body = payload.encode('utf-8')
+            # Servers can echo this digest instead of the whole payload
+            digest = hashlib.sha256(body).hexdigest()
+            
             # Send data
-            log_message(f"Sending data to server: {json.dumps(data)}", verbose=self.verbose)
+            if self.verbose:
+                log_message(f"Sending data to server: {payload}", verbose=self.verbose)
             response = self.session.post(
                 self.url,
-                headers=self.headers,
-                json=data,
+                headers={**self.headers, 'X-Payload-Digest': digest},
+                data=body,
                 timeout=self.timeout
             )
             
@@ -75,48 +152,94 @@ class ServerClient:
                 if not isinstance(response_json, dict):
                     error = "Server response is not a valid JSON object"
                     log_message(error, level='error', verbose=self.verbose)
-                    db.record_send_attempt(aggregation_time, False, error, None, json.dumps(data))
+                    db.record_send_attempt(aggregation_time, False, error, None, payload)
                     return False, error
                 
                 if "uid" not in response_json:
                     error = "Server response missing required 'uid' field"
                     log_message(error, level='error', verbose=self.verbose)
-                    db.record_send_attempt(aggregation_time, False, error, None, json.dumps(data))
+                    db.record_send_attempt(aggregation_time, False, error, None, payload)
                     return False, error
                 
-                # Verify data integrity
-                if "params" in response_json and response_json["params"] != data:
+                # Verify data integrity, preferring the echoed digest over a deep compare
+                if "payload_digest" in response_json:
+                    mismatch = response_json["payload_digest"] != digest
+                else:
+                    mismatch = "params" in response_json and response_json["params"] != data
+                if mismatch:
                     error = "Server response data does not match sent data"
                     log_message(error, level='error', verbose=self.verbose)
-                    db.record_send_attempt(aggregation_time, False, error, response_json["uid"], json.dumps(data))
+                    db.record_send_attempt(aggregation_time, False, error, response_json["uid"], payload)
                     return False, error
                 
                 # Record successful attempt
                 log_message("Data sent successfully", verbose=self.verbose)
-                db.record_send_attempt(aggregation_time, True, None, response_json["uid"], json.dumps(data))
+                db.record_send_attempt(aggregation_time, True, None, response_json["uid"], payload)
                 return True, None
             else:
                 error = f"Server returned non-200 status: {response.status_code}"
                 log_message(error, level='error', verbose=self.verbose)
-                db.record_send_attempt(aggregation_time, False, error, None, json.dumps(data))
+                db.record_send_attempt(aggregation_time, False, error, None, payload)
                 return False, error
                 
         except requests.RequestException as e:
             error = f"Failed to send data: {str(e)}"
             log_message(error, level='error', verbose=self.verbose)
-            db.record_send_attempt(aggregation_time, False, error, None, json.dumps(data))
+            db.record_send_attempt(aggregation_time, False, error, None, payload)
             return False, error
     
-    def __del__(self):
-        """Cleanup resources."""
-        self.session.close()
+    def close(self) -> None:
+        """Release this client's reference to the shared HTTP session.
+
+        The session and its pooled connections stay open for other clients;
+        _close_session() shuts them down.
+        """
+        self.session = None
+    
+    def __enter__(self) -> 'ServerClient':
+        """Use the client as a context manager."""
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        """Close the client when leaving the context."""
+        self.close()
+
+class _SendBuffer:
+    """Database stand-in that collects a backlog pass's writes for bulk flushing."""
+    
+    def __init__(self, db: Database):
+        self._db = db
+        self.attempts = []  # type: List[Tuple[Any, ...]]
+        self.failures = []  # type: List[Tuple[int, Optional[str]]]
+    
+    def record_send_attempt(self, aggregation_time: str, success: bool, error: Optional[str] = None,
+                            uid: Optional[str] = None, params: Optional[str] = None) -> None:
+        """Buffer the attempt instead of writing it."""
+        self.attempts.append((aggregation_time, datetime.now(), success, error, uid, params))
+    
+    def mark_aggregated_data_sent(self, data_id: int, success: bool, error: Optional[str] = None) -> None:
+        """Buffer failures; successes are marked in bulk from the send results."""
+        if not success:
+            self.failures.append((data_id, error))
+    
+    def flush(self) -> None:
+        """Write the buffered attempts and failures."""
+        self._db.record_send_attempts_bulk(self.attempts)
+        for data_id, error in self.failures:
+            self._db.mark_aggregated_data_sent(data_id, False, error)
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._db, name)
 
-def send_aggregated_data(data: Dict[str, Any], aggregation_time: str, server_url: str, db: Database, verbose: bool) -> bool:
+def send_aggregated_data(data: Dict[str, Any], aggregation_time: str, server_url: str, db: Database, verbose: bool,
+                         offline: bool = False) -> bool:
     """Send aggregated data to server."""
-    log_message(f"Sending data for {aggregation_time} to server: {json.dumps(data)}", verbose=verbose)
+    # Only pay for rendering the payload when it will actually be shown
+    if verbose:
+        log_message(f"Sending data for {aggregation_time} to server: {json.dumps(data)}", verbose=verbose)
     
-    # Create server client
-    client = ServerClient(server_url, data.get('contract_number', ''), verbose=verbose)
+    # Create server client; ServerClient defaults to offline, so say so explicitly
+    client = ServerClient(server_url, data.get('contract_number', ''), offline=offline, verbose=verbose)
     
     # Send data
     success, error = client.send_data(data, aggregation_time, db)
@@ -130,21 +253,38 @@ def send_aggregated_data(data: Dict[str, Any], aggregation_time: str, server_url
     
     return success
 
-def send_pending_data(db, server_url: str, verbose: bool) -> None:
+def send_pending_data(db, server_url: str, verbose: bool, offline: bool = False) -> None:
     """Send all pending aggregated data from the last 30 days."""
-    # Get unsent data
-    unsent_data = db.get_unsent_aggregated_data()
-    
-    # Send data in parallel
-    threads = []
-    for data in unsent_data:
-        thread = threading.Thread(
-            target=send_aggregated_data,
-            args=(data, data['aggregation_time'], server_url, db, verbose)
-        )
-        thread.start()
-        threads.append(thread)
-    
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
+    # Nothing can be sent, so don't query the backlog or start any workers
+    if not server_url or offline:
+        log_message("Server URL not configured or in offline mode, skipping pending data", verbose=verbose)
+        return
+    
+    # Get unsent data. The database returns the whole 30-day backlog as a list;
+    # chunking only bounds how many sends are queued on the pool at once
+    unsent_data = iter(db.get_unsent_aggregated_data())
+    chunk = list(islice(unsent_data, SEND_CHUNK_SIZE))
+    
+    if not chunk:
+        return
+    
+    # Send data in parallel on a bounded pool so a large backlog can't spawn
+    # a thread per row; results are written together once the pass is over
+    buffer = _SendBuffer(db)
+    sent_ids = []  # type: List[int]
+    try:
+        with ThreadPoolExecutor(max_workers=min(SEND_WORKERS, len(chunk))) as executor:
+            while chunk:
+                results = executor.map(
+                    lambda data: send_aggregated_data(
+                        data, data['aggregation_time'], server_url, buffer, verbose, offline
+                    ),
+                    chunk
+                )
+                sent_ids.extend(data['id'] for data, sent in zip(chunk, results) if sent and 'id' in data)
+                chunk = list(islice(unsent_data, SEND_CHUNK_SIZE))
+        db.mark_aggregated_data_sent_bulk(sent_ids, True)
+    finally:
+        buffer.flush()
+        # The backlog is drained; don't hold idle connections until the next run
+        _close_session()
@@ -62,6 +62,13 @@ class TestAggregation(unittest.TestCase):
         self.assertEqual(gpu["sm_utilization_percent_min"], 75)
         self.assertEqual(gpu["sm_utilization_percent_max"], 82)
 
+    def test_integer_extremes_stay_integers(self):
+        """Test that min/max of integer readings serialize without a decimal point"""
+        gpu = aggregate_gpu_data(self.gpu_data, verbose=False)[0]
+        self.assertIsInstance(gpu["sm_utilization_percent_min"], int)
+        self.assertIsInstance(gpu["sm_utilization_percent_max"], int)
+        self.assertIn('"sm_utilization_percent_min": 75,', json.dumps(gpu))
+
     def test_empty_collections(self):
         """Test aggregation with empty collections"""
         # Test with empty list
@@ -107,6 +114,21 @@ class TestAggregation(unittest.TestCase):
         self.assertAlmostEqual(gpu["memory_used_mb_mean"], 5632)
         self.assertAlmostEqual(gpu["sm_utilization_percent_mean"], 82)
 
+    def test_nan_values_skipped(self):
+        """Test that NaN readings don't poison the aggregates"""
+        nan_data = [
+            [{"device_id": "GPU-1234", "name": "NVIDIA GeForce RTX 3080", "power_usage_watts": 200}],
+            [{"device_id": "GPU-1234", "name": "NVIDIA GeForce RTX 3080", "power_usage_watts": float("nan")}],
+            [{"device_id": "GPU-1234", "name": "NVIDIA GeForce RTX 3080", "power_usage_watts": 220}]
+        ]
+
+        aggregated = aggregate_gpu_data(nan_data, verbose=False)
+
+        gpu = aggregated[0]
+        self.assertAlmostEqual(gpu["power_usage_watts_mean"], 210)
+        self.assertEqual(gpu["power_usage_watts_min"], 200)
+        self.assertEqual(gpu["power_usage_watts_max"], 220)
+
     def test_multiple_gpus(self):
         """Test aggregation with multiple GPUs"""
         # Create data for two GPUs
@@ -161,5 +183,28 @@ class TestAggregation(unittest.TestCase):
         self.assertAlmostEqual(gpu_3090["memory_used_mb_mean"], 13312)
         self.assertAlmostEqual(gpu_3090["sm_utilization_percent_mean"], 86.5)
 
+    def test_many_gpus(self):
+        """Test aggregation on a multi-GPU host"""
+        many_gpu_data = [
+            [
+                {
+                    "device_id": f"GPU-{index}",
+                    "name": "NVIDIA H100",
+                    "sm_utilization_percent": index * 10 + sample
+                }
+                for index in range(8)
+            ]
+            for sample in range(3)
+        ]
+
+        aggregated = aggregate_gpu_data(many_gpu_data, verbose=False)
+
+        # Device order is preserved
+        self.assertEqual([g["device_id"] for g in aggregated], [f"GPU-{i}" for i in range(8)])
+        for index, gpu in enumerate(aggregated):
+            self.assertAlmostEqual(gpu["sm_utilization_percent_mean"], index * 10 + 1)
+            self.assertEqual(gpu["sm_utilization_percent_min"], index * 10)
+            self.assertEqual(gpu["sm_utilization_percent_max"], index * 10 + 2)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
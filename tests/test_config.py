@@ -1,99 +1,133 @@
 import unittest
+import argparse
 import json
 import os
 import tempfile
-from pathlib import Path
+from unittest.mock import patch
 from gpu_monitor.config import (
-    get_config_path, load_config, is_offline_mode,
-    DEFAULT_CONFIG, validate_config
+    get_config, load_config_file, clear_config_cache,
+    DEFAULT_CONFIG, DEFAULT_INTERVALS, MIN_COLLECTION_INTERVAL
 )
 
+def _args(**overrides):
+    """Build the namespace parse_args would return for a plain run."""
+    values = dict(config=None, offline=False, verbose=False, log_level=None)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
 class TestConfig(unittest.TestCase):
     def setUp(self):
         # Create a temporary directory for test files
         self.test_dir = tempfile.TemporaryDirectory()
         self.original_cwd = os.getcwd()
         os.chdir(self.test_dir.name)
+        # Never pick up a config from the real home or /etc directories
+        self.config_paths = [
+            os.path.join(self.test_dir.name, name, "config.json")
+            for name in ("current", "home", "system")
+        ]
+        paths_patch = patch("gpu_monitor.config.DEFAULT_CONFIG_PATHS", self.config_paths)
+        paths_patch.start()
+        self.addCleanup(paths_patch.stop)
+        env_patch = patch.dict(os.environ)
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+        os.environ.pop("GPU_POLL_INTERVAL_SECONDS", None)
+        clear_config_cache()
 
     def tearDown(self):
         # Clean up
+        clear_config_cache()
         os.chdir(self.original_cwd)
         self.test_dir.cleanup()
 
+    def _write_config(self, path, config, mtime_ns=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
     def test_default_config(self):
-        """Test that default config is correct"""
-        config = load_config()
+        """Test that the defaults are used when no config file exists"""
+        config = load_config_file()
         self.assertEqual(config, DEFAULT_CONFIG)
-        self.assertTrue(is_offline_mode(config))
-
-    def test_offline_mode_conditions(self):
-        """Test all conditions that trigger offline mode"""
-        # Test 1: No config file
-        config = load_config()
-        self.assertTrue(is_offline_mode(config))
-
-        # Test 2: Empty URL
-        config = DEFAULT_CONFIG.copy()
-        config['server']['url'] = ""
-        self.assertTrue(is_offline_mode(config))
-
-        # Test 3: Offline flag in config
-        config = DEFAULT_CONFIG.copy()
-        config['server']['offline'] = True
-        self.assertTrue(is_offline_mode(config))
-
-    def test_online_mode_conditions(self):
-        """Test all conditions required for online mode"""
-        # Create a valid online config
-        config = DEFAULT_CONFIG.copy()
-        config['server']['url'] = "https://example.com"
-        config['server']['contract_number'] = "12345"
-        config['server']['offline'] = False
-
-        # Test validation
-        self.assertTrue(validate_config(config))
-        self.assertFalse(is_offline_mode(config))
-
-    def test_invalid_online_config(self):
-        """Test validation of invalid online configurations"""
-        # Test 1: Missing contract number
-        config = DEFAULT_CONFIG.copy()
-        config['server']['url'] = "https://example.com"
-        self.assertFalse(validate_config(config))
-
-        # Test 2: Empty contract number
-        config['server']['contract_number'] = ""
-        self.assertFalse(validate_config(config))
-
-        # Test 3: Invalid URL
-        config['server']['url'] = "not-a-url"
-        self.assertFalse(validate_config(config))
+        self.assertTrue(config['server']['offline'])
+
+        # The defaults themselves are never handed out for mutation
+        config['intervals']['collection'] = 1
+        self.assertEqual(DEFAULT_INTERVALS['collection'], 60)
+
+    def test_offline_flag(self):
+        """Test that --offline clears the server settings"""
+        path = self._write_config(self.config_paths[0], {
+            "server": {"url": "https://example.com", "contract_number": "12345", "offline": False}
+        })
+        config = get_config(_args(config=path, offline=True))
+        self.assertEqual(config['server']['url'], '')
+        self.assertIsNone(config['server']['contract_number'])
+        self.assertTrue(config['server']['offline'])
 
     def test_config_file_precedence(self):
         """Test config file location precedence"""
-        # Create config files in different locations
-        current_dir_config = Path("config.json")
-        home_config = Path.home() / ".gpu_monitor" / "config.json"
-        system_config = Path("/etc/gpu_monitor/config.json")
-
-        # Test current directory config
-        with open(current_dir_config, 'w') as f:
-            json.dump({"test": "current"}, f)
-        self.assertEqual(get_config_path(), current_dir_config)
-
-        # Test home directory config
-        current_dir_config.unlink()
-        home_config.parent.mkdir(parents=True, exist_ok=True)
-        with open(home_config, 'w') as f:
-            json.dump({"test": "home"}, f)
-        self.assertEqual(get_config_path(), home_config)
-
-        # Test system config
-        home_config.unlink()
-        system_config.parent.mkdir(parents=True, exist_ok=True)
-        with open(system_config, 'w') as f:
-            json.dump({"test": "system"}, f)
-        self.assertEqual(get_config_path(), system_config)
+        current, home, system = self.config_paths
+        for path in reversed(self.config_paths):
+            self._write_config(path, {"test": os.path.basename(os.path.dirname(path))})
+
+        self.assertEqual(load_config_file()["test"], "current")
+        os.remove(current)
+        self.assertEqual(load_config_file()["test"], "home")
+        os.remove(home)
+        self.assertEqual(load_config_file()["test"], "system")
+
+        # An explicit path wins over the default locations
+        explicit = self._write_config(os.path.join(self.test_dir.name, "explicit.json"), {"test": "explicit"})
+        self.assertEqual(load_config_file(explicit)["test"], "explicit")
+
+    def test_collection_interval_floor(self):
+        """Test that the collection interval can't go below the minimum"""
+        path = self._write_config(self.config_paths[0], {"intervals": {"collection": 1}})
+        config = get_config(_args(config=path))
+        self.assertEqual(config['intervals']['collection'], MIN_COLLECTION_INTERVAL)
+
+        self._write_config(path, {"intervals": {"collection": 30}}, mtime_ns=10 ** 18)
+        config = get_config(_args(config=path))
+        self.assertEqual(config['intervals']['collection'], 30)
+
+    def test_poll_interval_env_override(self):
+        """Test that GPU_POLL_INTERVAL_SECONDS overrides the config file"""
+        path = self._write_config(self.config_paths[0], {"intervals": {"collection": 30}})
+
+        os.environ["GPU_POLL_INTERVAL_SECONDS"] = "12.5"
+        self.assertEqual(get_config(_args(config=path))['intervals']['collection'], 12.5)
+
+        # The floor applies to the override too
+        os.environ["GPU_POLL_INTERVAL_SECONDS"] = "2"
+        self.assertEqual(get_config(_args(config=path))['intervals']['collection'], MIN_COLLECTION_INTERVAL)
+
+        # Unparseable values are ignored
+        os.environ["GPU_POLL_INTERVAL_SECONDS"] = "fast"
+        self.assertEqual(get_config(_args(config=path))['intervals']['collection'], 30)
+
+    def test_cached_config_is_private(self):
+        """Test that mutating a loaded config doesn't leak into the next load"""
+        path = self._write_config(self.config_paths[0], {"server": {"url": "https://example.com"}})
+        first = load_config_file(path)
+        first['server']['url'] = ''
+        self.assertEqual(load_config_file(path)['server']['url'], "https://example.com")
+
+    def test_cache_invalidated_on_mtime_change(self):
+        """Test that an edited config file is re-read"""
+        path = self._write_config(self.config_paths[0], {"test": "before"}, mtime_ns=10 ** 18)
+        with patch("gpu_monitor.config.json.load", wraps=json.load) as load:
+            self.assertEqual(load_config_file(path)["test"], "before")
+            self.assertEqual(load_config_file(path)["test"], "before")
+            self.assertEqual(load.call_count, 1)
+
+            self._write_config(path, {"test": "after"}, mtime_ns=10 ** 18 + 1)
+            self.assertEqual(load_config_file(path)["test"], "after")
+            self.assertEqual(load.call_count, 2)
 
 if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    unittest.main()
@@ -1,21 +1,119 @@
 import unittest
 import json
 import os
+import sqlite3
 import tempfile
+import threading
+from unittest.mock import patch
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from gpu_monitor.db import Database
+from gpu_monitor.db import Database, SCHEMA_VERSION
 
 class TestDatabase(unittest.TestCase):
     def setUp(self):
         # Create a temporary directory for test database
         self.test_dir = tempfile.TemporaryDirectory()
         self.db_file = os.path.join(self.test_dir.name, "test.db")
-        self.db = Database(self.db_file)
+        # Most tests never reopen the database, so keep it in memory and skip
+        # the file creation and fsyncs; persistence tests move it to disk
+        self.db = Database(":memory:")
 
     def tearDown(self):
         # Clean up
+        self.db.close()
         self.test_dir.cleanup()
 
+    def _reopen_on_disk(self, **kwargs):
+        """Replace the in-memory database with one backed by self.db_file."""
+        self.db.close()
+        self.db = Database(self.db_file, **kwargs)
+
+    def test_wal_mode_enabled(self):
+        """Test that the database is opened in WAL mode."""
+        self._reopen_on_disk()
+        journal_mode = self.db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+        synchronous = self.db.conn.execute("PRAGMA synchronous").fetchone()[0]
+        self.assertEqual(synchronous, 1)  # NORMAL
+
+    def test_journal_mode_override(self):
+        """Test that operators can opt back into rollback-journal mode."""
+        env = {"GPU_MONITOR_JOURNAL_MODE": "delete", "GPU_MONITOR_SYNCHRONOUS": "FULL"}
+        with patch.dict(os.environ, env):
+            with Database(os.path.join(self.test_dir.name, "journal.db")) as db:
+                journal_mode = db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+                self.assertEqual(journal_mode, "delete")
+                synchronous = db.conn.execute("PRAGMA synchronous").fetchone()[0]
+                self.assertEqual(synchronous, 2)  # FULL
+
+    def test_old_sqlite_rejected(self):
+        """Test that an SQLite too old for the schema fails at open."""
+        with patch("sqlite3.sqlite_version_info", (3, 22, 0)):
+            with self.assertRaises(sqlite3.NotSupportedError) as ctx:
+                Database(":memory:")
+        self.assertIn("3.24.0", str(ctx.exception))
+
+    def test_sqlite_without_json1_rejected(self):
+        """Test that an SQLite build without the JSON functions fails at open."""
+        real_connect = sqlite3.connect
+
+        def connect(*args, **kwargs):
+            conn = real_connect(*args, **kwargs)
+            # Mimic a build without JSON1 by denying access to its functions
+            conn.set_authorizer(lambda action, arg1, arg2, *rest:
+                                sqlite3.SQLITE_DENY if action == sqlite3.SQLITE_FUNCTION
+                                and arg2 == "json_valid" else sqlite3.SQLITE_OK)
+            return conn
+
+        with patch("gpu_monitor.db.sqlite3.connect", connect):
+            with self.assertRaises(sqlite3.NotSupportedError) as ctx:
+                Database(":memory:")
+        self.assertIn("JSON1", str(ctx.exception))
+
+    def test_hot_queries_use_indexes(self):
+        """Test that the range and unsent-data lookups use indexes."""
+        def plan(sql, params):
+            rows = self.db.conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            return " ".join(row[-1] for row in rows)
+
+        self.assertIn("idx_collections_ts", plan(
+            "SELECT data FROM collections WHERE timestamp BETWEEN ? AND ?", ("a", "b")))
+        self.assertIn("idx_agg_sent_time", plan(
+            "SELECT id FROM aggregated_data WHERE sent = 0 AND aggregation_time > ?", ("a",)))
+        self.assertIn("idx_send_attempts_agg_num", plan(
+            "SELECT * FROM send_attempts WHERE aggregation_time = ?", ("a",)))
+        self.assertIn("SEARCH gpu_samples USING COVERING INDEX idx_gpu_samples_ts", plan(
+            "SELECT rowid FROM gpu_samples WHERE ts < ? LIMIT 5000", (1,)))
+        self.assertIn("COVERING INDEX idx_send_attempts_agg_num", plan(
+            "SELECT MAX(attempt_number) FROM send_attempts WHERE aggregation_time = ?", ("a",)))
+
+    def test_schema_version(self):
+        """Test that the schema version is recorded and survives reopening."""
+        self._reopen_on_disk()
+        version = self.db.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, SCHEMA_VERSION)
+
+        # A current schema is opened without running any DDL
+        self.db.close()
+        with patch.object(Database, "_create_tables") as create_tables:
+            self.db = Database(self.db_file)
+        create_tables.assert_not_called()
+        version = self.db.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, SCHEMA_VERSION)
+
+        # A schema from a newer release is left alone but reported
+        self.db.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION + 1}")
+        self.db.close()
+        with self.assertLogs("gpu_monitor.db", level="WARNING"):
+            self.db = Database(self.db_file)
+
+    def test_context_manager_closes_connection(self):
+        """Test that leaving the context closes the connection."""
+        with Database(os.path.join(self.test_dir.name, "ctx.db")) as db:
+            db.save_collection({"gpus": [{"device_id": "GPU-1234"}]})
+        with self.assertRaises(sqlite3.ProgrammingError):
+            db.conn.execute("SELECT 1")
+
     def test_store_and_load_raw_data(self):
         """Test storing and loading raw GPU data."""
         # Create sample GPU data
@@ -47,6 +145,152 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(len(collections), 1)
         self.assertEqual(collections[0], gpu_data)
 
+    def test_save_collections_batch(self):
+        """Test storing several raw collections in one batch."""
+        batch = [
+            {"gpus": [{"device_id": "GPU-1234", "memory_used_mb": 5120}]},
+            {"gpus": [{"device_id": "GPU-1234", "memory_used_mb": 6144}]},
+            {"gpus": [{"device_id": "GPU-1234", "memory_used_mb": 7168}]}
+        ]
+
+        self.db.save_collections_batch(batch)
+
+        start_time = (datetime.now() - timedelta(minutes=1)).isoformat()
+        end_time = datetime.now().isoformat()
+        collections = self.db.get_collections_for_aggregation(start_time, end_time)
+        self.assertEqual(collections, batch)
+
+    def test_concurrent_writes(self):
+        """Test that the connection can be shared between threads."""
+        def worker():
+            for _ in range(25):
+                self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]})
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        count = self.db.conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+        self.assertEqual(count, 100)
+
+    def test_gpu_samples(self):
+        """Test that collections are flattened into the gpu_samples table."""
+        self._reopen_on_disk()
+        gpus = [
+            {"uid": "GPU-1", "name": "A100", "temperature": 60, "gpu_utilization": 75, "power_usage": 250.5},
+            {"uid": "GPU-2", "name": "A100", "temperature": 55, "gpu_utilization": 10, "power_usage": 90.0},
+        ]
+        self.db.save_collection({"gpus": gpus})
+        rows = self.db.conn.execute(
+            "SELECT gpu_uid, temperature, gpu_utilization, power_usage FROM gpu_samples ORDER BY gpu_uid"
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [("GPU-1", 60, 75, 250.5), ("GPU-2", 55, 10, 90.0)])
+
+        # Reopening an older schema expands the stored collections
+        self.db.conn.execute("DROP TABLE gpu_samples")
+        self.db.conn.execute("PRAGMA user_version=3")
+        self.db.close()
+        self.db = Database(self.db_file)
+        count = self.db.conn.execute("SELECT COUNT(*) FROM gpu_samples").fetchone()[0]
+        self.assertEqual(count, 2)
+
+    def test_queued_writes_from_threads(self):
+        """Test that concurrent send records are numbered and committed correctly."""
+        aggregation_time = datetime.now().replace(minute=0, second=0, microsecond=0).isoformat()
+        threads = [
+            threading.Thread(target=self.db.record_send_attempt, args=(aggregation_time, False, "timeout"))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        attempts = self.db.get_send_attempts(aggregation_time)
+        self.assertEqual(sorted(a["attempt_number"] for a in attempts), list(range(1, 9)))
+        self.assertEqual(self.db.get_send_by_time(aggregation_time)["attempts"], 8)
+
+        # A failing write raises in its caller and leaves the queue usable
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db.save_aggregated_data({"gpus": []}, None)
+        self.assertIsNotNone(self.db.save_aggregated_data({"gpus": []}, aggregation_time))
+
+    def test_writes_racing_close(self):
+        """Test that a write racing close() either commits or raises, never hangs."""
+        aggregation_time = datetime.now().isoformat()
+        outcomes = []
+
+        def writer():
+            for _ in range(50):
+                try:
+                    self.db.record_send_attempt(aggregation_time, False, "timeout")
+                    outcomes.append("ok")
+                except sqlite3.ProgrammingError:
+                    outcomes.append("closed")
+
+        threads = [threading.Thread(target=writer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        self.db.close()
+        for thread in threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(len(outcomes), 200)
+
+        # Writes already queued behind the shutdown sentinel are failed, not dropped
+        self.db = Database(":memory:")
+        future = Future()
+        self.db._write_queue.put(None)
+        self.db._write_queue.put(("SELECT 1", (), future))
+        self.db._writer_thread.join(timeout=5)
+        self.assertIsInstance(future.exception(timeout=5), sqlite3.ProgrammingError)
+
+    def test_buffered_collections(self):
+        """Test that buffered collections are written once the batch is full."""
+        self.db.close()
+        self.db = Database(":memory:", flush_every_n=3)
+
+        def stored_count():
+            return self.db.conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+
+        self.assertIsNone(self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]}))
+        self.assertIsNone(self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]}))
+        self.assertEqual(stored_count(), 0)
+
+        self.assertIsNotNone(self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]}))
+        self.assertEqual(stored_count(), 3)
+
+        # Reads see collections that are still buffered
+        self.db.save_collection({"gpus": [{"device_id": "GPU-5678"}]})
+        start_time = (datetime.now() - timedelta(minutes=1)).isoformat()
+        end_time = datetime.now().isoformat()
+        collections = self.db.get_collections_for_aggregation(start_time, end_time)
+        self.assertEqual(len(collections), 4)
+
+    def test_failed_flush_rolls_back(self):
+        """Test that a failed flush writes nothing and keeps the rows buffered."""
+        # Malformed JSON makes the gpu_samples insert fail after the collection insert
+        self.db._pending.append((0, "not json"))
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.flush()
+        count = self.db.conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+        self.assertEqual(count, 0)
+        self.assertEqual(len(self.db._pending), 1)
+        self.assertFalse(self.db.conn.in_transaction)
+        self.db._pending.clear()
+
+    def test_close_flushes_buffer(self):
+        """Test that closing the database writes pending collections."""
+        self._reopen_on_disk(flush_every_n=10)
+        self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]})
+        self.db.close()
+
+        self.db = Database(self.db_file)
+        count = self.db.conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+        self.assertEqual(count, 1)
+
     def test_aggregated_data(self):
         """Test aggregated data storage and retrieval."""
         # Create sample aggregated data
@@ -73,7 +317,7 @@ class TestDatabase(unittest.TestCase):
         # Get unsent data
         unsent_data = self.db.get_unsent_aggregated_data()
         self.assertEqual(len(unsent_data), 1)
-        self.assertEqual(unsent_data[0]['data'], json.dumps(aggregated_data))
+        self.assertEqual(json.loads(unsent_data[0]['data']), aggregated_data)
 
     def test_send_attempts(self):
         """Test send attempt recording and retrieval."""
@@ -98,11 +342,152 @@ class TestDatabase(unittest.TestCase):
         # Get attempts
         attempts = self.db.get_send_attempts(aggregation_time)
         self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.db.count_send_attempts(aggregation_time), 2)
+        self.assertEqual(self.db.count_send_attempts("1970-01-01T00:00:00"), 0)
         self.assertEqual(attempts[0]['attempt_number'], 1)
         self.assertEqual(attempts[1]['attempt_number'], 2)
         self.assertTrue(attempts[0]['success'])
         self.assertFalse(attempts[1]['success'])
 
+    def test_record_send_attempts_bulk(self):
+        """Test that buffered attempts are numbered and summarised like single ones."""
+        aggregation_time = datetime.now().replace(minute=0, second=0, microsecond=0).isoformat()
+        first = datetime.now().replace(microsecond=100000) - timedelta(minutes=1)
+        second = first + timedelta(seconds=5)
+        self.db.record_send_attempt(aggregation_time, False, "timeout")
+        self.db.record_send_attempts_bulk([
+            (aggregation_time, first.isoformat(), False, "refused", None, None),
+            (aggregation_time, second, True, None, "uid-1", '{"gpus": []}'),
+        ])
+        self.db.record_send_attempts_bulk([])
+
+        attempts = self.db.get_send_attempts(aggregation_time)
+        numbers = {a["timestamp"]: a["attempt_number"] for a in attempts}
+        self.assertEqual((numbers[first.isoformat()], numbers[second.isoformat()]), (2, 3))
+        summary = self.db.get_send_by_time(aggregation_time)
+        self.assertEqual(summary["attempts"], 3)
+        self.assertEqual(summary["uid"], "uid-1")
+        self.assertEqual(summary["sent"], 1)
+
+    def test_send_summary(self):
+        """Test the per-aggregation send summary."""
+        aggregation_time = datetime.now().replace(minute=0, second=0, microsecond=0).isoformat()
+
+        self.db.record_send_attempt(aggregation_time, False, error="Connection timeout")
+        self.db.record_send_attempt(aggregation_time, False, error="Server returned non-200 status: 500")
+        self.db.record_send_attempt(aggregation_time, True, uid="test-uid-1")
+
+        sends = self.db.get_all_sends()
+        self.assertEqual(len(sends), 1)
+        summary = sends[0]
+        self.assertEqual(summary['aggregation_time'], aggregation_time)
+        self.assertEqual(summary['attempts'], 3)
+        self.assertEqual(summary['last_error'], "Server returned non-200 status: 500")
+        self.assertEqual(summary['uid'], "test-uid-1")
+        self.assertEqual(summary['sent'], 1)
+        self.assertLessEqual(summary['first_attempt'], summary['last_attempt'])
+
+        self.assertEqual(self.db.get_send_by_time(aggregation_time), summary)
+        self.assertIsNone(self.db.get_send_by_time("2000-01-01T00:00:00"))
+
+    def test_collection_timestamps_are_integers(self):
+        """Test that collections store epoch-microsecond timestamps and show ISO."""
+        self.db.save_collection({"gpus": [{"device_id": "GPU-1234"}]})
+        stored = self.db.conn.execute("SELECT timestamp FROM collections").fetchone()[0]
+        self.assertIsInstance(stored, int)
+
+        shown = self.db.get_collection_by_time()[0]["timestamp"]
+        self.assertEqual(len(self.db.get_collection_by_time(shown)), 1)
+
+    def test_migrates_text_timestamps(self):
+        """Test that a database with ISO TEXT timestamps is converted on open."""
+        legacy_file = os.path.join(self.test_dir.name, "legacy.db")
+        timestamp = datetime.now().replace(microsecond=123456).isoformat()
+        conn = sqlite3.connect(legacy_file)
+        conn.execute("""
+            CREATE TABLE collections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                data TEXT NOT NULL,
+                sent INTEGER DEFAULT 0,
+                error TEXT
+            )
+        """)
+        conn.execute("INSERT INTO collections (timestamp, data) VALUES (?, ?)",
+                     (timestamp, '{"gpus":[]}'))
+        conn.commit()
+        conn.close()
+
+        with Database(legacy_file) as db:
+            stored = db.conn.execute("SELECT typeof(timestamp) FROM collections").fetchone()[0]
+            self.assertEqual(stored, "integer")
+            collections = db.get_collection_by_time(timestamp)
+            self.assertEqual(collections, [{"timestamp": timestamp, "gpus": []}])
+
+    def test_migrates_text_send_times(self):
+        """Test that ISO TEXT aggregation and attempt times are converted on open."""
+        legacy_file = os.path.join(self.test_dir.name, "legacy_sends.db")
+        aggregation_time = datetime.now().replace(minute=0, second=0, microsecond=0).isoformat()
+        attempt_time = datetime.now().replace(microsecond=654321).isoformat()
+        conn = sqlite3.connect(legacy_file)
+        conn.executescript("""
+            CREATE TABLE aggregated_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                aggregation_time TEXT NOT NULL,
+                data TEXT NOT NULL,
+                sent INTEGER DEFAULT 0,
+                error TEXT
+            );
+            CREATE TABLE send_attempts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                aggregation_time TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                success INTEGER DEFAULT 0,
+                error TEXT,
+                uid TEXT,
+                params TEXT,
+                attempt_number INTEGER DEFAULT 1
+            );
+        """)
+        conn.execute("INSERT INTO aggregated_data (aggregation_time, data) VALUES (?, ?)",
+                     (aggregation_time, '{"gpus":[]}'))
+        conn.execute("INSERT INTO send_attempts (aggregation_time, timestamp, error) VALUES (?, ?, ?)",
+                     (aggregation_time, attempt_time, "timeout"))
+        conn.commit()
+        conn.close()
+
+        with Database(legacy_file) as db:
+            for table, column in (("aggregated_data", "aggregation_time"),
+                                  ("send_attempts", "timestamp"),
+                                  ("send_summary", "first_attempt")):
+                stored = db.conn.execute(f"SELECT typeof({column}) FROM {table}").fetchone()[0]
+                self.assertEqual(stored, "integer")
+            unsent = db.get_unsent_aggregated_data()
+            self.assertEqual(unsent[0]["aggregation_time"], aggregation_time)
+            attempts = db.get_send_attempts(aggregation_time)
+            self.assertEqual(attempts[0]["timestamp"], attempt_time)
+            summary = db.get_send_by_time(aggregation_time)
+            self.assertEqual(summary["attempts"], 1)
+            self.assertEqual(summary["last_error"], "timeout")
+            db.record_send_attempt(aggregation_time, True, None, "uid-1")
+            self.assertEqual(db.count_send_attempts(aggregation_time), 2)
+
+    def test_gpu_dict_normalized(self):
+        """Test that old-style gpus dicts are stored in the array format."""
+        self._reopen_on_disk()
+        legacy = {"gpus": {"0": {"name": "RTX 3080", "temperature": 60}}}
+        expected = [{"name": "RTX 3080", "temperature": 60, "uid": "gpu_0_RTX_3080"}]
+        self.db.save_collection(legacy)
+        self.assertEqual(self.db.get_collection_by_time()[0]["gpus"], expected)
+
+        # Rows written before the normalization are converted on upgrade
+        self.db.conn.execute("UPDATE collections SET data = ?", (json.dumps(legacy),))
+        self.db.conn.execute("PRAGMA user_version=5")
+        self.db.close()
+        self.db = Database(self.db_file)
+        stored = json.loads(self.db.conn.execute("SELECT json(data) FROM collections").fetchone()[0])
+        self.assertEqual(stored["gpus"], expected)
+
     def test_data_retention(self):
         """Test data retention policies."""
         # Create old data
@@ -140,7 +525,29 @@ class TestDatabase(unittest.TestCase):
         # Check aggregated data
         unsent_data = self.db.get_unsent_aggregated_data()
         self.assertEqual(len(unsent_data), 1)
-        self.assertEqual(unsent_data[0]['data'], json.dumps(recent_aggregated))
+        self.assertEqual(json.loads(unsent_data[0]['data']), recent_aggregated)
+
+    def test_retention_thread(self):
+        """Test that the retention thread prunes old data in small batches."""
+        old_us = int((datetime.now() - timedelta(days=31)).timestamp() * 1000000)
+        self.db.conn.executemany("INSERT INTO collections (timestamp, data) VALUES (?, '{}')",
+                                 [(old_us,)] * 5)
+
+        def count():
+            return self.db.conn.execute("SELECT COUNT(*) FROM collections").fetchone()[0]
+
+        with patch("gpu_monitor.db._RETENTION_BATCH_SIZE", 2):
+            self.db.start_retention(0.01)
+            for _ in range(200):
+                if count() == 0:
+                    break
+                threading.Event().wait(0.01)
+        self.assertEqual(count(), 0)
+
+        thread = self.db._retention_thread
+        self.db.close()
+        self.assertFalse(thread.is_alive())
+        self.db = Database(":memory:")
 
     def test_mark_aggregated_data_sent(self):
         """Test marking aggregated data as sent."""
@@ -159,5 +566,22 @@ class TestDatabase(unittest.TestCase):
         unsent_data = self.db.get_unsent_aggregated_data()
         self.assertEqual(len(unsent_data), 1)
 
+    def test_mark_aggregated_data_sent_bulk(self):
+        """Test marking several aggregated rows in one call."""
+        aggregation_time = datetime.now().replace(minute=0, second=0, microsecond=0)
+        data_ids = [
+            self.db.save_aggregated_data({"gpus": []}, (aggregation_time - timedelta(hours=i)).isoformat())
+            for i in range(3)
+        ]
+
+        self.db.mark_aggregated_data_sent_bulk(data_ids[:2], True)
+        self.db.mark_aggregated_data_sent_bulk([], True)
+        unsent_data = self.db.get_unsent_aggregated_data()
+        self.assertEqual([row["id"] for row in unsent_data], [data_ids[2]])
+
+        self.db.mark_aggregated_data_sent_bulk(data_ids[:2], False, "Test error")
+        errors = self.db.conn.execute("SELECT error FROM aggregated_data ORDER BY id").fetchall()
+        self.assertEqual([row[0] for row in errors], ["Test error", "Test error", None])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,63 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+import pynvml
+from gpu_monitor import nvml
+from gpu_monitor.nvml import initialize_nvml, get_gpu_info, shutdown_nvml
+
+def _pci_info(bus_id):
+    """Build a real PCI info struct so field decoding matches the bindings."""
+    info = pynvml.nvmlPciInfo_t()
+    info.busId = bus_id
+    return info
+
+def _not_supported(*args):
+    raise pynvml.NVMLError(pynvml.NVML_ERROR_NOT_SUPPORTED)
+
+class TestNvml(unittest.TestCase):
+    def setUp(self):
+        # One fanless GPU; every NVML call is answered without a driver
+        self.nvml = patch.multiple(
+            pynvml,
+            nvmlInit=lambda: None,
+            nvmlShutdown=lambda: None,
+            nvmlDeviceGetCount=lambda: 1,
+            nvmlDeviceGetHandleByIndex=lambda index: "handle-0",
+            nvmlDeviceGetUUID=lambda handle: "GPU-1234",
+            nvmlDeviceGetPciInfo=lambda handle: _pci_info(b"00000000:01:00.0"),
+            nvmlDeviceGetName=lambda handle: "NVIDIA H100",
+            nvmlDeviceGetMemoryInfo=lambda handle: SimpleNamespace(total=80 << 30, used=1 << 30),
+            nvmlDeviceGetTemperature=lambda handle, sensor: 40,
+            nvmlDeviceGetUtilizationRates=lambda handle: SimpleNamespace(gpu=75, memory=60),
+            nvmlDeviceGetPowerUsage=lambda handle: 200000,
+            nvmlDeviceGetFanSpeed=_not_supported,
+            nvmlDeviceGetClockInfo=lambda handle, clock: 1800,
+        )
+        self.nvml.start()
+        self.addCleanup(self.nvml.stop)
+        self.addCleanup(nvml._DEVICES.clear)
+
+    def test_initialize_and_collect(self):
+        """Test that discovery and polling work against the bindings' types"""
+        initialize_nvml()
+        gpu = get_gpu_info()["gpus"][0]
+
+        self.assertEqual(gpu["uid"], "GPU-1234")
+        self.assertEqual(gpu["pci_bus_id"], "00000000:01:00.0")
+        self.assertEqual(gpu["memory_total"], 80 << 30)
+        self.assertEqual(gpu["power_usage"], 200.0)
+        self.assertEqual(gpu["graphics_clock"], 1800)
+
+    def test_unsupported_metrics_reported_as_none(self):
+        """Test that a metric the device can't report doesn't fail the poll"""
+        initialize_nvml()
+        self.assertIsNone(get_gpu_info()["gpus"][0]["fan_speed"])
+
+    def test_shutdown_forgets_handles(self):
+        """Test that handles aren't reused after NVML is shut down"""
+        initialize_nvml()
+        shutdown_nvml()
+        self.assertEqual(nvml._DEVICES, [])
+
+if __name__ == '__main__':
+    unittest.main()
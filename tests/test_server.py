@@ -1,209 +1,286 @@
-import unittest
 import json
+import logging
+from copy import deepcopy
 from unittest.mock import patch, MagicMock
-from datetime import datetime
-from gpu_monitor.server import ServerClient, send_aggregated_data, send_pending_data
-
-class TestServerClient(unittest.TestCase):
-    def setUp(self):
-        self.server_url = "http://test-server.com"
-        self.contract_number = "TEST-123"
-        self.client = ServerClient(self.server_url, self.contract_number, verbose=True)
-        self.db = MagicMock()
-
-    def test_send_data_success(self):
-        """Test successful data sending."""
-        # Prepare test data
-        data = {
-            "gpus": [{
-                "device_id": "GPU-1234",
-                "name": "NVIDIA GeForce RTX 3080",
-                "avg_memory_used_mb": 5120,
-                "avg_sm_utilization_percent": 75
-            }]
-        }
-        aggregation_time = datetime.now().isoformat()
-        
-        # Mock successful response
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "uid": "test-uid-1",
-            "params": data
-        }
-        
-        # Test sending
-        with patch('requests.Session.post', return_value=mock_response):
-            success, error = self.client.send_data(data, aggregation_time, self.db)
-            
-            # Verify results
-            self.assertTrue(success)
-            self.assertIsNone(error)
-            self.db.record_send_attempt.assert_called_once_with(
-                aggregation_time=aggregation_time,
-                success=True,
-                error=None,
-                uid="test-uid-1",
-                params=json.dumps(data)
-            )
-
-    def test_send_data_failure(self):
-        """Test failed data sending."""
-        # Prepare test data
-        data = {
-            "gpus": [{
-                "device_id": "GPU-1234",
-                "name": "NVIDIA GeForce RTX 3080",
-                "avg_memory_used_mb": 5120,
-                "avg_sm_utilization_percent": 75
-            }]
-        }
-        aggregation_time = datetime.now().isoformat()
-        
-        # Mock failed response
-        mock_response = MagicMock()
-        mock_response.status_code = 500
-        mock_response.text = "Internal Server Error"
-        
-        # Test sending
-        with patch('requests.Session.post', return_value=mock_response):
-            success, error = self.client.send_data(data, aggregation_time, self.db)
-            
-            # Verify results
-            self.assertFalse(success)
-            self.assertIsNotNone(error)
-            self.db.record_send_attempt.assert_called_once_with(
-                aggregation_time=aggregation_time,
-                success=False,
-                error="Server returned non-200 status: 500",
-                uid=None,
-                params=json.dumps(data)
-            )
-
-    def test_send_data_retry_limit(self):
-        """Test retry limit for data sending."""
-        # Prepare test data
-        data = {
-            "gpus": [{
-                "device_id": "GPU-1234",
-                "name": "NVIDIA GeForce RTX 3080",
-                "avg_memory_used_mb": 5120,
-                "avg_sm_utilization_percent": 75
-            }]
-        }
-        aggregation_time = datetime.now().isoformat()
-        
-        # Mock multiple failed attempts
-        self.db.get_send_attempts.return_value = [
-            {"attempt_number": i} for i in range(1, 11)
-        ]
-        
-        # Test sending
-        success, error = self.client.send_data(data, aggregation_time, self.db)
-        
+import pytest
+from gpu_monitor.db import Database
+from gpu_monitor.server import (
+    HTTP_POOL_SIZE, SEND_WORKERS, ServerClient, send_aggregated_data, send_pending_data, _make_retry
+)
+
+_SERVER_URL = "http://test-server.com"
+_CONTRACT_NUMBER = "TEST-123"
+_SAMPLE_DATA = {
+    "gpus": [{
+        "device_id": "GPU-1234",
+        "name": "NVIDIA GeForce RTX 3080",
+        "avg_memory_used_mb": 5120,
+        "avg_sm_utilization_percent": 75
+    }]
+}
+# send_data stamps the contract number onto the payload it serializes
+_SAMPLE_PARAMS_JSON = json.dumps({**_SAMPLE_DATA, "contract_number": _CONTRACT_NUMBER})
+_FIXED_AGG_TIME = "2024-01-01T00:00:00"
+# Introspect Database once; copying a prototype mock would share child mocks
+_DB_SPEC = [name for name in dir(Database) if not name.startswith('_')]
+
+def _make_db_mock():
+    """Return a fresh database mock restricted to the public Database API."""
+    db = MagicMock(spec=_DB_SPEC)
+    # No earlier attempts unless a test says otherwise
+    db.count_send_attempts.return_value = 0
+    return db
+
+@pytest.fixture
+def client():
+    """An online client; clients share one HTTP session, so this is cheap."""
+    with ServerClient(_SERVER_URL, _CONTRACT_NUMBER, offline=False) as client:
+        yield client
+
+@pytest.fixture
+def db():
+    return _make_db_mock()
+
+def _expect_record(db, *, success, error, uid):
+    """Assert the single recorded attempt for the sample payload."""
+    # send_data passes (aggregation_time, success, error, uid, params) positionally
+    db.record_send_attempt.assert_called_once_with(
+        _FIXED_AGG_TIME, success, error, uid, _SAMPLE_PARAMS_JSON
+    )
+
+# requests_mock intercepts at the transport adapter, so sends go through the real Session
+
+def test_send_data_success(client, db, requests_mock):
+    """Test successful data sending."""
+    # send_data adds the contract number, so work on a copy of the sample
+    data = deepcopy(_SAMPLE_DATA)
+
+    # Mock successful response
+    requests_mock.post(_SERVER_URL, status_code=200, json={
+        "uid": "test-uid-1",
+        "params": {**_SAMPLE_DATA, "contract_number": _CONTRACT_NUMBER}
+    })
+
+    # Test sending
+    success, error = client.send_data(data, _FIXED_AGG_TIME, db)
+
+    # Verify results
+    assert success
+    assert error is None
+    _expect_record(db, success=True, error=None, uid="test-uid-1")
+
+def test_send_data_failure(client, db, requests_mock):
+    """Test failed data sending."""
+    # send_data adds the contract number, so work on a copy of the sample
+    data = deepcopy(_SAMPLE_DATA)
+
+    # Mock failed response
+    requests_mock.post(_SERVER_URL, status_code=500, text="Internal Server Error")
+
+    # Test sending
+    success, error = client.send_data(data, _FIXED_AGG_TIME, db)
+
+    # Verify results
+    assert not success
+    assert error is not None
+    _expect_record(db, success=False, error="Server returned non-200 status: 500", uid=None)
+
+def test_send_data_retry_limit(client, db, requests_mock):
+    """Test retry limit for data sending."""
+    data = deepcopy(_SAMPLE_DATA)
+
+    # Mock multiple failed attempts
+    db.count_send_attempts.return_value = 10
+
+    # Test sending
+    success, error = client.send_data(data, _FIXED_AGG_TIME, db)
+
+    # Verify results
+    assert not success
+    assert error == "Maximum retry attempts (10) reached"
+    db.record_send_attempt.assert_not_called()
+    assert not requests_mock.called
+
+# Invalid 200 responses: (response body, expected error, recorded uid)
+_VALIDATION_CASES = [
+    pytest.param([], "Server response is not a valid JSON object", None, id="not-an-object"),
+    pytest.param({}, "Server response missing required 'uid' field", None, id="missing-uid"),
+    pytest.param({"uid": "test-uid-1", "params": {"different": "data"}},
+                 "Server response data does not match sent data", "test-uid-1", id="data-mismatch"),
+]
+
+@pytest.mark.parametrize("body,expected_error,expected_uid", _VALIDATION_CASES)
+def test_send_data_validation(client, db, requests_mock, body, expected_error, expected_uid):
+    """Test response validation."""
+    # send_data adds the contract number, so work on a copy of the sample
+    data = deepcopy(_SAMPLE_DATA)
+    requests_mock.post(_SERVER_URL, status_code=200, json=body)
+
+    success, error = client.send_data(data, _FIXED_AGG_TIME, db)
+
+    # Verify results
+    assert not success
+    assert error == expected_error
+    _expect_record(db, success=False, error=expected_error, uid=expected_uid)
+
+def test_send_data_payload_digest(client, db, requests_mock):
+    """Test that an echoed payload digest is checked instead of the params."""
+    data = {"gpus": [{"device_id": "GPU-1234"}]}
+
+    def echo_digest(request, context):
+        return {"uid": "test-uid-1", "payload_digest": request.headers["X-Payload-Digest"]}
+
+    requests_mock.post(_SERVER_URL, json=echo_digest)
+    assert client.send_data(data, _FIXED_AGG_TIME, db) == (True, None)
+    # Session-level and per-client headers are both sent
+    headers = requests_mock.last_request.headers
+    assert headers["Content-Type"] == "application/json"
+    assert headers["X-Contract-Number"] == _CONTRACT_NUMBER
+
+    requests_mock.post(_SERVER_URL, json={"uid": "test-uid-1", "payload_digest": "0" * 64})
+    success, error = client.send_data(data, _FIXED_AGG_TIME, db)
+    assert not success
+    assert error == "Server response data does not match sent data"
+
+def test_send_data_encodes_current_payload(client, db, requests_mock):
+    """Test that resending a dict changed since the last send posts the new contents."""
+    requests_mock.post(_SERVER_URL, status_code=500)
+    data = deepcopy(_SAMPLE_DATA)
+
+    client.send_data(data, _FIXED_AGG_TIME, db)
+    data["gpus"][0]["avg_sm_utilization_percent"] = 80
+    client.send_data(data, _FIXED_AGG_TIME, db)
+
+    first, second = requests_mock.request_history
+    assert first.body == _SAMPLE_PARAMS_JSON.encode('utf-8')
+    assert json.loads(second.body)["gpus"][0]["avg_sm_utilization_percent"] == 80
+    assert second.headers["X-Payload-Digest"] != first.headers["X-Payload-Digest"]
+
+def test_send_data_verbose_logs_payload(db, requests_mock, caplog):
+    """Test that a verbose client logs the payload it sends."""
+    requests_mock.post(_SERVER_URL, json={"uid": "test-uid-1"})
+
+    with ServerClient(_SERVER_URL, _CONTRACT_NUMBER, offline=False, verbose=True) as client:
+        with caplog.at_level(logging.INFO):
+            client.send_data(deepcopy(_SAMPLE_DATA), _FIXED_AGG_TIME, db)
+    assert f"Sending data to server: {_SAMPLE_PARAMS_JSON}" in caplog.text
+
+def test_retry_policy():
+    """Test that only gateway errors on POST are retried, with backoff."""
+    retry = _make_retry()
+    assert retry.total == 3
+    assert retry.backoff_factor > 0
+    assert 503 in retry.status_forcelist
+    assert retry.is_retry("POST", 503)
+    assert not retry.is_retry("POST", 400)
+    # Only the gateway statuses drive retries; a POST that may have landed isn't resent
+    assert retry.connect == 0
+    assert retry.read == 0
+
+def test_session_has_pooled_adapter(client):
+    """Test that the shared session pools enough connections for every send worker."""
+    for url in ("http://metrics.example", "https://metrics.example"):
+        adapter = client.session.get_adapter(url)
+        assert adapter._pool_maxsize == HTTP_POOL_SIZE
+        assert adapter._pool_maxsize >= SEND_WORKERS
+        assert adapter.max_retries.total == _make_retry().total
+
+def test_close_keeps_shared_session_open(client):
+    """Test that closing one client doesn't tear down the pool others use."""
+    shared = client.session
+    other = ServerClient(_SERVER_URL, _CONTRACT_NUMBER, offline=False)
+    other.close()
+    assert other.session is None
+    assert client.session is shared
+    # A new client still gets the same pooled session
+    with ServerClient(_SERVER_URL, _CONTRACT_NUMBER, offline=False) as another:
+        assert another.session is shared
+
+def test_send_aggregated_data(db):
+    """Test sending aggregated data."""
+    # Prepare test data
+    data = {"id": 1, **deepcopy(_SAMPLE_DATA)}
+
+    # Mock successful send
+    with patch('gpu_monitor.server.ServerClient.send_data', return_value=(True, None)):
+        success = send_aggregated_data(data, _FIXED_AGG_TIME, _SERVER_URL, db, False)
+
         # Verify results
-        self.assertFalse(success)
-        self.assertEqual(error, "Maximum retry attempts (10) reached")
-        self.db.record_send_attempt.assert_not_called()
-
-    def test_send_data_validation(self):
-        """Test response validation."""
-        # Prepare test data
-        data = {
-            "gpus": [{
-                "device_id": "GPU-1234",
-                "name": "NVIDIA GeForce RTX 3080",
-                "avg_memory_used_mb": 5120,
-                "avg_sm_utilization_percent": 75
-            }]
-        }
-        aggregation_time = datetime.now().isoformat()
-        
-        # Test cases for invalid responses
-        test_cases = [
-            # Invalid JSON
-            (MagicMock(status_code=200, json=MagicMock(side_effect=ValueError())),
-             "Server response is not a valid JSON object"),
-            
-            # Missing UID
-            (MagicMock(status_code=200, json=MagicMock(return_value={})),
-             "Server response missing required 'uid' field"),
-            
-            # Data mismatch
-            (MagicMock(status_code=200, json=MagicMock(return_value={
-                "uid": "test-uid-1",
-                "params": {"different": "data"}
-            })),
-             "Server response data does not match sent data")
-        ]
-        
-        for mock_response, expected_error in test_cases:
-            with patch('requests.Session.post', return_value=mock_response):
-                success, error = self.client.send_data(data, aggregation_time, self.db)
-                
-                # Verify results
-                self.assertFalse(success)
-                self.assertEqual(error, expected_error)
-                self.db.record_send_attempt.assert_called_with(
-                    aggregation_time=aggregation_time,
-                    success=False,
-                    error=expected_error,
-                    uid=None if "uid" not in mock_response.json.return_value else "test-uid-1",
-                    params=json.dumps(data)
-                )
-
-class TestSendFunctions(unittest.TestCase):
-    def setUp(self):
-        self.db = MagicMock()
-        self.server_url = "http://test-server.com"
-        self.verbose = True
-
-    def test_send_aggregated_data(self):
-        """Test sending aggregated data."""
-        # Prepare test data
-        data = {
+        assert success
+        db.mark_aggregated_data_sent.assert_called_once_with(data['id'], True)
+
+def test_send_aggregated_data_verbose_logs_payload(db, caplog):
+    """Test that verbose sends log the aggregation being sent."""
+    with patch('gpu_monitor.server.ServerClient.send_data', return_value=(True, None)):
+        with caplog.at_level(logging.INFO):
+            send_aggregated_data(deepcopy(_SAMPLE_DATA), _FIXED_AGG_TIME, _SERVER_URL, db, True)
+    assert f"Sending data for {_FIXED_AGG_TIME} to server:" in caplog.text
+
+def test_send_pending_data(db):
+    """Test sending pending data."""
+    # Prepare test data
+    unsent_data = [
+        {
             "id": 1,
-            "gpus": [{
-                "device_id": "GPU-1234",
-                "name": "NVIDIA GeForce RTX 3080",
-                "avg_memory_used_mb": 5120,
-                "avg_sm_utilization_percent": 75
-            }]
+            "aggregation_time": _FIXED_AGG_TIME,
+            "data": json.dumps({"gpus": [{"device_id": "GPU-1234"}]})
+        },
+        {
+            "id": 2,
+            "aggregation_time": "2024-01-01T01:00:00",
+            "data": json.dumps({"gpus": [{"device_id": "GPU-5678"}]})
         }
-        aggregation_time = datetime.now().isoformat()
-        
-        # Mock successful send
-        with patch('gpu_monitor.server.ServerClient.send_data', return_value=(True, None)):
-            success = send_aggregated_data(data, aggregation_time, self.server_url, self.db, self.verbose)
-            
-            # Verify results
-            self.assertTrue(success)
-            self.db.mark_aggregated_data_sent.assert_called_once_with(data['id'], True)
-
-    def test_send_pending_data(self):
-        """Test sending pending data."""
-        # Prepare test data
-        unsent_data = [
-            {
-                "id": 1,
-                "aggregation_time": datetime.now().isoformat(),
-                "data": json.dumps({"gpus": [{"device_id": "GPU-1234"}]})
-            },
-            {
-                "id": 2,
-                "aggregation_time": datetime.now().isoformat(),
-                "data": json.dumps({"gpus": [{"device_id": "GPU-5678"}]})
-            }
-        ]
-        self.db.get_unsent_aggregated_data.return_value = unsent_data
-        
-        # Mock successful sends
-        with patch('gpu_monitor.server.send_aggregated_data', return_value=True):
-            send_pending_data(self.db, self.server_url, self.verbose)
-            
-            # Verify results
-            self.assertEqual(self.db.get_unsent_aggregated_data.call_count, 1)
-            self.assertEqual(self.db.mark_aggregated_data_sent.call_count, 2)
-
-if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    ]
+    # Any iterable backlog works; it is handed to the pool a chunk at a time
+    db.get_unsent_aggregated_data.side_effect = lambda: iter(unsent_data)
+
+    # Mock successful sends, one row per chunk
+    with patch('gpu_monitor.server.send_aggregated_data', return_value=True), \
+            patch('gpu_monitor.server.SEND_CHUNK_SIZE', 1):
+        send_pending_data(db, _SERVER_URL, False)
+
+        # Verify results
+        assert db.get_unsent_aggregated_data.call_count == 1
+        db.mark_aggregated_data_sent_bulk.assert_called_once_with([1, 2], True)
+        db.mark_aggregated_data_sent.assert_not_called()
+
+def test_send_pending_data_posts(db, requests_mock):
+    """Test that a backlog pass really posts each row before marking it sent."""
+    db.get_unsent_aggregated_data.return_value = [
+        {"id": 1, "aggregation_time": _FIXED_AGG_TIME, "data": "{}"},
+        {"id": 2, "aggregation_time": "2024-01-01T01:00:00", "data": "{}"}
+    ]
+    requests_mock.post(_SERVER_URL, json={"uid": "test-uid-1"})
+
+    send_pending_data(db, _SERVER_URL, False)
+
+    assert requests_mock.call_count == 2
+    db.mark_aggregated_data_sent_bulk.assert_called_once_with([1, 2], True)
+    (attempts,), _ = db.record_send_attempts_bulk.call_args
+    assert sorted(attempt[4] for attempt in attempts) == ["test-uid-1"] * 2
+
+def test_send_pending_data_records_in_bulk(db):
+    """Test that attempts from a pass are written in one bulk insert."""
+    db.get_unsent_aggregated_data.return_value = [
+        {"id": 1, "aggregation_time": _FIXED_AGG_TIME, "data": "{}"}
+    ]
+
+    def send(data, aggregation_time, server_url, db, verbose, offline):
+        assert not offline
+        db.record_send_attempt(aggregation_time, False, "timeout")
+        return False
+
+    with patch('gpu_monitor.server.send_aggregated_data', side_effect=send):
+        send_pending_data(db, _SERVER_URL, False)
+
+    db.record_send_attempt.assert_not_called()
+    (attempts,), _ = db.record_send_attempts_bulk.call_args
+    assert len(attempts) == 1
+    assert attempts[0][0] == _FIXED_AGG_TIME
+    assert attempts[0][2:4] == (False, "timeout")
+
+def test_send_pending_data_offline(db):
+    """Test that nothing is queried or sent without a server."""
+    send_pending_data(db, "", False)
+    send_pending_data(db, _SERVER_URL, False, offline=True)
+    db.get_unsent_aggregated_data.assert_not_called()